@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import pandas as pd
 
 from . import database
+from .layout import export_sheet
 from .models import Batch, StickerSize
 
 
@@ -50,8 +51,7 @@ def save_sticker_size(sticker: StickerSize) -> int:
 
 def create_batch(name: str, sticker_size_id: int, serials: List[str]) -> Batch:
     created_at = datetime.now().isoformat(timespec="seconds")
-    batch_id = database.insert_batch(name, created_at, sticker_size_id, len(serials))
-    database.insert_serials(batch_id, serials)
+    batch_id = database.insert_batch_with_serials(name, created_at, sticker_size_id, serials)
     row = database.fetch_batch(batch_id)
     return Batch(
         id=batch_id,
@@ -93,6 +93,22 @@ def load_batch(batch_id: int) -> Optional[Batch]:
     )
 
 
+def load_batch_sticker(batch_id: int) -> Optional[StickerSize]:
+    row = database.fetch_batch(batch_id)
+    if not row or row["width"] is None:
+        return None
+    return StickerSize(
+        id=row["sticker_size_id"],
+        name=row["sticker_name"],
+        width=row["width"],
+        height=row["height"],
+        margin_x=row["margin_x"],
+        margin_y=row["margin_y"],
+        rows=row["rows"],
+        cols=row["cols"],
+    )
+
+
 def get_batch_serials(batch_id: int) -> List[str]:
     return database.fetch_serials(batch_id)
 
@@ -108,3 +124,28 @@ def export_serials_csv(batch: Batch, serials: List[str], output_path: str) -> No
         }
     )
     df.to_csv(output_path, index=False)
+
+
+def export_batch_sheet(
+    batch_id: int,
+    on_page: Optional[Callable[[int], None]] = None,
+    output_path: Optional[str] = None,
+) -> str:
+    row = database.fetch_batch(batch_id)
+    if not row:
+        raise ValueError(f"Batch {batch_id} does not exist")
+    if row["width"] is None:
+        raise ValueError("The sticker size of this batch no longer exists")
+    return export_sheet(
+        batch_id,
+        get_batch_serials(batch_id),
+        row["sticker_name"],
+        row["width"],
+        row["height"],
+        row["margin_x"],
+        row["margin_y"],
+        row["rows"],
+        row["cols"],
+        on_page=on_page,
+        output_path=output_path,
+    )
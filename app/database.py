@@ -1,6 +1,8 @@
 import os
 import sqlite3
-from typing import Iterable, List, Optional
+from typing import Iterable, List, Optional, Sequence
+
+from .models import UNFINISHED_JOB_STATUSES
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "app.db")
 os.makedirs(os.path.join(os.path.dirname(__file__), "..", "data"), exist_ok=True)
@@ -37,11 +39,48 @@ CREATE_TABLES_SQL = [
         FOREIGN KEY (batch_id) REFERENCES batches(id)
     );
     """,
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        sticker_size_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        batch_id INTEGER,
+        serials_done INTEGER NOT NULL DEFAULT 0,
+        pngs_done INTEGER NOT NULL DEFAULT 0,
+        pages_done INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        FOREIGN KEY (sticker_size_id) REFERENCES sticker_sizes(id),
+        FOREIGN KEY (batch_id) REFERENCES batches(id)
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_serials_batch_id ON serials (batch_id);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """,
 ]
 
+# SQLite's INCREMENTAL auto-vacuum mode, see PRAGMA auto_vacuum.
+AUTO_VACUUM_INCREMENTAL = 2
+# Keeps IN (...) lists below SQLite's bound-parameter limit.
+DELETE_CHUNK_SIZE = 500
+
+
+# Generation and export jobs run in separate worker processes, so writers may
+# briefly wait on each other's locks instead of failing straight away.
+BUSY_TIMEOUT_SECONDS = 30
+
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SECONDS)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -49,6 +88,12 @@ def get_connection() -> sqlite3.Connection:
 def init_db() -> None:
     conn = get_connection()
     cur = conn.cursor()
+    # Switching an existing database to incremental auto-vacuum only takes
+    # effect after a full VACUUM, which is done once here.
+    if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        cur.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        cur.execute("VACUUM")
+    cur.execute("PRAGMA journal_mode=WAL")
     for statement in CREATE_TABLES_SQL:
         cur.executescript(statement)
     conn.commit()
@@ -115,8 +160,30 @@ def update_sticker_size(
 
 
 def delete_sticker_size(sticker_id: int) -> None:
+    # Refuses while saved batches, or unfinished jobs that have not created
+    # their batch yet, still use the size. The check and the delete share one
+    # write transaction, so nothing can start using it in between.
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("SELECT COUNT(*) FROM batches WHERE sticker_size_id = ?", (sticker_id,))
+    batch_count = cur.fetchone()[0]
+    placeholders = ", ".join("?" for _ in UNFINISHED_JOB_STATUSES)
+    cur.execute(
+        f"""
+        SELECT COUNT(*) FROM jobs
+        WHERE sticker_size_id = ? AND batch_id IS NULL AND status IN ({placeholders})
+        """,
+        (sticker_id, *UNFINISHED_JOB_STATUSES),
+    )
+    job_count = cur.fetchone()[0]
+    if batch_count or job_count:
+        conn.rollback()
+        conn.close()
+        raise ValueError(
+            f"{batch_count} saved batch(es) and {job_count} unfinished job(s) use this sticker size. "
+            "Delete those batches or cancel those jobs first."
+        )
     cur.execute("DELETE FROM sticker_sizes WHERE id = ?", (sticker_id,))
     conn.commit()
     conn.close()
@@ -149,6 +216,34 @@ def insert_serials(batch_id: int, serials: Iterable[str]) -> None:
     conn.close()
 
 
+def insert_batch_with_serials(name: str, created_at: str, sticker_size_id: int, serials: Sequence[str]) -> int:
+    # One transaction, so a failed insert never leaves a batch without serials.
+    conn = get_connection()
+    cur = conn.cursor()
+    batch_id = _insert_batch_rows(cur, name, created_at, sticker_size_id, serials)
+    conn.commit()
+    conn.close()
+    return batch_id
+
+
+def _insert_batch_rows(
+    cur: sqlite3.Cursor, name: str, created_at: str, sticker_size_id: int, serials: Sequence[str]
+) -> int:
+    cur.execute(
+        """
+        INSERT INTO batches (name, created_at, sticker_size_id, count)
+        VALUES (?, ?, ?, ?)
+        """,
+        (name, created_at, sticker_size_id, len(serials)),
+    )
+    batch_id = cur.lastrowid
+    cur.executemany(
+        "INSERT INTO serials (batch_id, serial) VALUES (?, ?)",
+        [(batch_id, serial) for serial in serials],
+    )
+    return batch_id
+
+
 def fetch_batches() -> List[sqlite3.Row]:
     conn = get_connection()
     cur = conn.cursor()
@@ -183,15 +278,229 @@ def fetch_batch(batch_id: int) -> Optional[sqlite3.Row]:
     return row
 
 
-def fetch_serials(batch_id: int) -> List[str]:
+def fetch_serials(batch_id: int, limit: Optional[int] = None) -> List[str]:
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT serial FROM serials WHERE batch_id = ? ORDER BY id", (batch_id,))
+    cur.execute(
+        "SELECT serial FROM serials WHERE batch_id = ? ORDER BY id LIMIT ?",
+        (batch_id, -1 if limit is None else limit),
+    )
     rows = [r[0] for r in cur.fetchall()]
     conn.close()
     return rows
 
 
+def fetch_serial_page(batch_id: int, after_id: int, limit: int) -> List[sqlite3.Row]:
+    # Keyset paging: each page starts after the last serial id of the previous
+    # one, so reading deep into a large batch costs no more than the first page.
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, serial FROM serials WHERE batch_id = ? AND id > ? ORDER BY id LIMIT ?",
+        (batch_id, after_id, limit),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+JOB_COLUMNS = (
+    "id, name, sticker_size_id, count, status, batch_id, serials_done, pngs_done, "
+    "pages_done, error, created_at, updated_at"
+)
+
+
+def insert_job(name: str, sticker_size_id: int, count: int, status: str, created_at: str) -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO jobs (name, sticker_size_id, count, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (name, sticker_size_id, count, status, created_at, created_at),
+    )
+    job_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def fetch_job(job_id: int) -> Optional[sqlite3.Row]:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+def fetch_jobs_by_status(statuses: Sequence[str]) -> List[sqlite3.Row]:
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join("?" for _ in statuses)
+    cur.execute(
+        f"SELECT {JOB_COLUMNS} FROM jobs WHERE status IN ({placeholders}) ORDER BY id",
+        tuple(statuses),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def update_job_status(job_id: int, status: str, updated_at: str, error: Optional[str] = None) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+        (status, error, updated_at, job_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def transition_job_status(job_id: int, from_statuses: Sequence[str], status: str, updated_at: str) -> bool:
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join("?" for _ in from_statuses)
+    cur.execute(
+        f"UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN ({placeholders})",
+        (status, updated_at, job_id, *from_statuses),
+    )
+    changed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def update_job_pngs(job_id: int, pngs_done: int, updated_at: str) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE jobs SET pngs_done = ?, updated_at = ? WHERE id = ?",
+        (pngs_done, updated_at, job_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def update_job_pages(job_id: int, pages_done: int, updated_at: str) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE jobs SET pages_done = ?, updated_at = ? WHERE id = ?",
+        (pages_done, updated_at, job_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def insert_job_batch(job_id: int, created_at: str, serials: Sequence[str]) -> int:
+    # The batch row, its serials and the job checkpoint are written in a single
+    # transaction so a crash never leaves a batch with a partial serial list.
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT name, sticker_size_id FROM jobs WHERE id = ?", (job_id,))
+    job = cur.fetchone()
+    batch_id = _insert_batch_rows(cur, job["name"], created_at, job["sticker_size_id"], serials)
+    cur.execute(
+        "UPDATE jobs SET batch_id = ?, serials_done = ?, updated_at = ? WHERE id = ?",
+        (batch_id, len(serials), created_at, job_id),
+    )
+    conn.commit()
+    conn.close()
+    return batch_id
+
+
+def delete_batches(batch_ids: Sequence[int]) -> None:
+    # All rows go in one transaction so a batch never loses its serials while
+    # its batch row (or a job pointing at it) survives.
+    conn = get_connection()
+    cur = conn.cursor()
+    for start in range(0, len(batch_ids), DELETE_CHUNK_SIZE):
+        chunk = tuple(batch_ids[start:start + DELETE_CHUNK_SIZE])
+        placeholders = ", ".join("?" for _ in chunk)
+        cur.execute(f"UPDATE jobs SET batch_id = NULL WHERE batch_id IN ({placeholders})", chunk)
+        cur.execute(f"DELETE FROM serials WHERE batch_id IN ({placeholders})", chunk)
+        cur.execute(f"DELETE FROM batches WHERE id IN ({placeholders})", chunk)
+    conn.commit()
+    conn.close()
+
+
+def fetch_batch_ids_with_unfinished_jobs(statuses: Sequence[str]) -> List[int]:
+    conn = get_connection()
+    cur = conn.cursor()
+    placeholders = ", ".join("?" for _ in statuses)
+    cur.execute(
+        f"SELECT DISTINCT batch_id FROM jobs WHERE batch_id IS NOT NULL AND status IN ({placeholders})",
+        tuple(statuses),
+    )
+    rows = [r[0] for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def fetch_last_batch_id() -> int:
+    # batches.id is AUTOINCREMENT, so sqlite_sequence holds the highest id ever
+    # handed out, even if that batch has since been deleted.
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'batches'")
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def fetch_batch_summaries() -> List[sqlite3.Row]:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, created_at, count FROM batches ORDER BY created_at, id")
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def database_size() -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+    page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = cur.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    return page_size * (page_count - free_pages)
+
+
+def compact() -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    # Returns all free pages to the file system, then folds the WAL back into
+    # the main file and truncates it. incremental_vacuum frees one page per
+    # step, so it goes through executescript, which runs it to completion.
+    cur.executescript("PRAGMA incremental_vacuum;")
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def fetch_setting(key: str) -> Optional[str]:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def save_setting(key: str, value: str) -> None:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+    conn.commit()
+    conn.close()
+
+
 DEFAULT_STICKERS = [
     ("1in x 1in", 25.4, 25.4, 5.0, 5.0, 8, 3),
     ("2in x 1in", 50.8, 25.4, 5.0, 5.0, 8, 2),
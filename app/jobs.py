@@ -0,0 +1,169 @@
+import os
+import shutil
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from . import batches, database, thumbnails
+from .layout import export_sheet
+from .models import (
+    JOB_CANCELLED,
+    JOB_CANCELLING,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_RUNNING,
+    UNFINISHED_JOB_STATUSES,
+    Batch,
+    Job,
+)
+from .qr_utils import batch_folder, ensure_batch_folder, save_qr_image
+from .serials import generate_unique_serials
+
+# Number of QR images rendered between two checkpoint writes.
+PNG_CHECKPOINT_INTERVAL = 250
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def row_to_job(row) -> Job:
+    return Job(
+        id=row["id"],
+        name=row["name"],
+        sticker_size_id=row["sticker_size_id"],
+        count=row["count"],
+        status=row["status"],
+        batch_id=row["batch_id"],
+        serials_done=row["serials_done"],
+        pngs_done=row["pngs_done"],
+        pages_done=row["pages_done"],
+        error=row["error"],
+        created_at=datetime.fromisoformat(row["created_at"]),
+        updated_at=datetime.fromisoformat(row["updated_at"]),
+    )
+
+
+def create_job(name: str, sticker_size_id: int, count: int) -> Job:
+    job_id = database.insert_job(name, sticker_size_id, count, JOB_PENDING, _now())
+    return load_job(job_id)
+
+
+def load_job(job_id: int) -> Optional[Job]:
+    row = database.fetch_job(job_id)
+    if not row:
+        return None
+    return row_to_job(row)
+
+
+def list_unfinished_jobs() -> List[Job]:
+    # A job still marked as running on startup was interrupted by a crash or
+    # by closing the app, so it is resumed just like a pending one.
+    return [row_to_job(row) for row in database.fetch_jobs_by_status(UNFINISHED_JOB_STATUSES)]
+
+
+def run_job(
+    job_id: int,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Optional[Batch]:
+    job = load_job(job_id)
+    if not job or job.status not in UNFINISHED_JOB_STATUSES:
+        return None
+    # The conditional update fails when a cancel was recorded after the job
+    # was loaded, so that request is never overwritten.
+    if job.status == JOB_CANCELLING or not database.transition_job_status(
+        job.id, (JOB_PENDING, JOB_RUNNING), JOB_RUNNING, _now()
+    ):
+        cancel_job(job.id)
+        return None
+
+    def report(message: str) -> None:
+        if should_cancel and should_cancel():
+            raise JobCancelled()
+        if progress:
+            progress(message)
+
+    try:
+        report(job.progress_display)
+        if job.batch_id is None:
+            report(f"Generating {job.count} serial numbers...")
+            serials = generate_unique_serials(job.count)
+            database.insert_job_batch(job.id, _now(), serials)
+            job = load_job(job.id)
+        else:
+            serials = batches.get_batch_serials(job.batch_id)
+
+        sticker_row = database.fetch_batch(job.batch_id)
+        if sticker_row["width"] is None:
+            raise ValueError("The sticker size of this job no longer exists")
+
+        _render_pngs(job, serials, report)
+
+        def on_page(pages: int) -> None:
+            database.update_job_pages(job.id, pages, _now())
+            report(f"Wrote {pages} PDF pages")
+
+        export_sheet(
+            job.batch_id,
+            serials,
+            sticker_row["sticker_name"],
+            sticker_row["width"],
+            sticker_row["height"],
+            sticker_row["margin_x"],
+            sticker_row["margin_y"],
+            sticker_row["rows"],
+            sticker_row["cols"],
+            on_page=on_page,
+        )
+    except JobCancelled:
+        cancel_job(job.id)
+        return None
+    except Exception as exc:
+        database.update_job_status(job.id, JOB_FAILED, _now(), str(exc))
+        raise
+    database.update_job_status(job.id, JOB_DONE, _now())
+    return batches.load_batch(job.batch_id)
+
+
+def _render_pngs(job: Job, serials: List[str], report: Callable[[str], None]) -> None:
+    folder = ensure_batch_folder(job.batch_id)
+    # Images up to the last checkpoint are known to be complete; anything after
+    # it may have been cut off mid-write and is rendered again.
+    done = job.pngs_done
+    for idx in range(done, len(serials)):
+        serial = serials[idx]
+        save_qr_image(serial, os.path.join(folder, f"{serial}.png"))
+        done = idx + 1
+        if done % PNG_CHECKPOINT_INTERVAL == 0 or done == len(serials):
+            database.update_job_pngs(job.id, done, _now())
+            report(f"Rendered {done}/{len(serials)} QR images")
+
+
+def request_cancel(job_id: int) -> bool:
+    # The request is stored in the jobs table, so a job cancelled while it was
+    # queued, or while its worker was stopped by closing the app, is cleaned up
+    # instead of resumed on the next launch. Returns True when nothing is left
+    # to clean up; otherwise run_job() removes the partial batch.
+    job = load_job(job_id)
+    if not job or job.status not in UNFINISHED_JOB_STATUSES:
+        return True
+    if job.batch_id is None and database.transition_job_status(job.id, (JOB_PENDING,), JOB_CANCELLED, _now()):
+        return True
+    database.transition_job_status(job.id, (JOB_PENDING, JOB_RUNNING), JOB_CANCELLING, _now())
+    return False
+
+
+def cancel_job(job_id: int) -> None:
+    job = load_job(job_id)
+    if not job:
+        return
+    if job.batch_id is not None:
+        database.delete_batches([job.batch_id])
+        shutil.rmtree(batch_folder(job.batch_id), ignore_errors=True)
+        thumbnails.purge_batch(job.batch_id)
+    database.update_job_status(job.id, JOB_CANCELLED, _now())
@@ -1,10 +1,10 @@
 import os
-from typing import Iterable, Sequence
+from typing import Callable, Iterable, Optional, Sequence
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
-from .qr_utils import ensure_batch_folder, save_qr_image
+from .qr_utils import atomic_output, ensure_batch_folder, remove_stale_parts, save_qr_image
 
 DEFAULT_PAGE_SIZE = A4
 
@@ -19,9 +19,40 @@ def export_sheet(
     margin_y_mm: float,
     rows: int,
     cols: int,
+    on_page: Optional[Callable[[int], None]] = None,
+    output_path: Optional[str] = None,
 ) -> str:
     folder = ensure_batch_folder(batch_id)
-    pdf_path = os.path.join(folder, f"{sticker_name.replace(' ', '_')}_sheet.pdf")
+    pdf_path = output_path or sheet_path(batch_id, sticker_name)
+    remove_stale_parts(batch_id)
+    with atomic_output(pdf_path) as temp_path:
+        _draw_sheet(
+            temp_path, folder, serials, width_mm, height_mm, margin_x_mm, margin_y_mm, rows, cols, on_page
+        )
+    return pdf_path
+
+
+def sheet_path(batch_id: int, sticker_name: str) -> str:
+    folder = ensure_batch_folder(batch_id)
+    return os.path.join(folder, sheet_filename(sticker_name))
+
+
+def sheet_filename(sticker_name: str) -> str:
+    return f"{sticker_name.replace(' ', '_')}_sheet.pdf"
+
+
+def _draw_sheet(
+    pdf_path: str,
+    folder: str,
+    serials: Sequence[str],
+    width_mm: float,
+    height_mm: float,
+    margin_x_mm: float,
+    margin_y_mm: float,
+    rows: int,
+    cols: int,
+    on_page: Optional[Callable[[int], None]],
+) -> None:
     c = canvas.Canvas(pdf_path, pagesize=DEFAULT_PAGE_SIZE)
     page_width, page_height = DEFAULT_PAGE_SIZE
 
@@ -31,11 +62,10 @@ def export_sheet(
     margin_y = margin_y_mm / 25.4 * 72
 
     idx = 0
+    pages = 0
     for serial in serials:
         col_idx = idx % cols
         row_idx = (idx // cols) % rows
-        if row_idx == 0 and col_idx == 0 and idx > 0 and idx % (rows * cols) == 0:
-            c.showPage()
         x = margin_x + col_idx * (sticker_width + margin_x)
         y = page_height - margin_y - sticker_height - row_idx * (sticker_height + margin_y)
 
@@ -47,5 +77,9 @@ def export_sheet(
         idx += 1
         if idx % (rows * cols) == 0:
             c.showPage()
+            pages += 1
+            if on_page:
+                on_page(pages)
     c.save()
-    return pdf_path
+    if idx % (rows * cols) and on_page:
+        on_page(pages + 1)
@@ -1,6 +1,16 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+# Cancel requested, but the job's partial batch has not been removed yet.
+JOB_CANCELLING = "cancelling"
+
+UNFINISHED_JOB_STATUSES = (JOB_PENDING, JOB_RUNNING, JOB_CANCELLING)
 
 
 @dataclass
@@ -31,3 +41,48 @@ class Batch:
     @property
     def created_display(self) -> str:
         return self.created_at.strftime("%Y-%m-%d %H:%M")
+
+
+@dataclass
+class Job:
+    id: int
+    name: str
+    sticker_size_id: int
+    count: int
+    status: str
+    batch_id: Optional[int]
+    serials_done: int
+    pngs_done: int
+    pages_done: int
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    @property
+    def progress_display(self) -> str:
+        if self.batch_id is None:
+            return "Waiting to generate serial numbers"
+        if self.pngs_done < self.count:
+            return f"Rendered {self.pngs_done}/{self.count} QR images"
+        return f"Wrote {self.pages_done} PDF pages"
+
+
+@dataclass
+class RunnerTask:
+    id: int
+    kind: str
+    label: str
+    priority: int
+    status: str
+    message: str = ""
+
+
+@dataclass
+class RetentionPolicy:
+    # 0 disables the respective limit.
+    max_age_days: int = 0
+    max_total_mb: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_total_mb > 0
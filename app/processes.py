@@ -0,0 +1,53 @@
+import ctypes
+import os
+import threading
+from typing import Optional
+
+# Windows process access right and exit code, see OpenProcess/GetExitCodeProcess.
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+PARENT_CHECK_SECONDS = 1.0
+
+
+def process_running(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill() would terminate the process on Windows, so ask for its
+        # exit code instead.
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _parent_alive(parent_pid: int) -> bool:
+    if os.name == "nt":
+        return process_running(parent_pid)
+    # A dead parent may linger as a zombie, but its children are re-parented
+    # at once.
+    return os.getppid() == parent_pid
+
+
+def exit_with_parent(parent_pid: int, stop: Optional[threading.Event] = None) -> None:
+    # A terminated process cannot stop its own children, so runner workers and
+    # their page render pools each watch their parent and exit once it is gone.
+    # Setting ``stop`` (a multiprocessing Event) ends the process at once too,
+    # even in the middle of a task.
+    stop = stop or threading.Event()
+
+    def watch() -> None:
+        while _parent_alive(parent_pid) and not stop.wait(PARENT_CHECK_SECONDS):
+            pass
+        os._exit(1)
+
+    threading.Thread(target=watch, name="exit-with-parent", daemon=True).start()
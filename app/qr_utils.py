@@ -1,27 +1,119 @@
+import io
 import os
-from typing import Iterable
+import re
+import zipfile
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
 
 import qrcode
 from PIL import Image
 
+from .processes import process_running
+
+
+BATCHES_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "batches")
+# "<target>.<pid>.part", as produced by part_path() and atomic_output().
+_PART_NAME = re.compile(r"^.+\.(\d+)\.part$")
+
+
+def batch_folder(batch_id: int) -> str:
+    return os.path.join(BATCHES_DIR, str(batch_id))
+
 
 def ensure_batch_folder(batch_id: int) -> str:
-    folder = os.path.join(os.path.dirname(__file__), "..", "data", "batches", str(batch_id))
+    folder = batch_folder(batch_id)
     os.makedirs(folder, exist_ok=True)
     return folder
 
 
-def save_qr_image(serial: str, output_path: str, box_size: int = 10) -> None:
+def part_path(path: str) -> str:
+    # Exports are written to a temporary file and moved into place once done,
+    # so an interrupted export never leaves a truncated file behind. The name
+    # carries the writer's pid, which lets remove_stale_parts() tell the files
+    # of killed exports from ones still being written.
+    return f"{path}.{os.getpid()}.part"
+
+
+@contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    # Yields the temporary name to write to. It replaces ``path`` once the
+    # block completes and is removed if the block raises (cancel included).
+    temp_path = part_path(path)
+    try:
+        yield temp_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+
+
+def remove_stale_parts(batch_id: int) -> int:
+    # Only ever sweeps the app's own batch folder: folders picked by the user
+    # may hold other programs' .part files (e.g. browser downloads).
+    freed = 0
+    try:
+        entries = list(os.scandir(batch_folder(batch_id)))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        match = _PART_NAME.match(entry.name)
+        if not match or not entry.is_file() or process_running(int(match.group(1))):
+            continue
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        freed += size
+    return freed
+
+
+def make_qr_image(serial: str, box_size: int = 10):
     qr = qrcode.QRCode(box_size=box_size, border=2)
     qr.add_data(serial)
     qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(output_path)
+    return qr.make_image(fill_color="black", back_color="white")
+
+
+def save_qr_image(serial: str, output_path: str, box_size: int = 10) -> None:
+    make_qr_image(serial, box_size).save(output_path)
+
+
+def render_qr_png(serial: str, box_size: int = 10) -> bytes:
+    buffer = io.BytesIO()
+    make_qr_image(serial, box_size).save(buffer, format="PNG")
+    return buffer.getvalue()
 
 
-def export_qr_images(batch_id: int, serials: Iterable[str]) -> str:
+def export_qr_images(
+    batch_id: int,
+    serials: Iterable[str],
+    on_image: Optional[Callable[[int], None]] = None,
+) -> str:
     folder = ensure_batch_folder(batch_id)
-    for serial in serials:
+    for idx, serial in enumerate(serials, start=1):
         filename = f"{serial}.png"
         save_qr_image(serial, os.path.join(folder, filename))
+        if on_image:
+            on_image(idx)
     return folder
+
+
+def codes_zip_filename(batch_id: int) -> str:
+    return f"batch_{batch_id}_codes.zip"
+
+
+def export_qr_zip(batch_id: int, serials: Iterable[str], output_path: Optional[str] = None) -> str:
+    folder = ensure_batch_folder(batch_id)
+    zip_path = output_path or os.path.join(folder, codes_zip_filename(batch_id))
+    remove_stale_parts(batch_id)
+    # PNGs are already compressed, so they are stored rather than deflated.
+    with atomic_output(zip_path) as temp_path:
+        with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for serial in serials:
+                img_path = os.path.join(folder, f"{serial}.png")
+                if not os.path.exists(img_path):
+                    save_qr_image(serial, img_path)
+                archive.write(img_path, arcname=f"{serial}.png")
+    return zip_path
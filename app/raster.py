@@ -0,0 +1,238 @@
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, closing
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import qrcode
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+
+from .models import StickerSize
+from .processes import exit_with_parent
+from .qr_utils import atomic_output, ensure_batch_folder
+
+DEFAULT_DPI = 300
+# Same page as the PDF sheet in layout.py (A4 portrait).
+PAGE_WIDTH_MM = 210.0
+PAGE_HEIGHT_MM = 297.0
+# Matches the PDF sheet: serial text about 10pt high, 2pt below the sticker.
+TEXT_HEIGHT_PT = 10.0
+TEXT_GAP_PT = 2.0
+# Below this many pages the process pool costs more than it saves.
+PARALLEL_MIN_PAGES = 4
+# Pages rendered ahead of the writer per pool process; bounds memory when
+# the file is written more slowly than pages are rendered.
+PAGES_AHEAD_PER_WORKER = 2
+FONT_CANDIDATES = ("DejaVuSans.ttf", "arial.ttf", "Helvetica.ttc")
+_FONT_RENDER_SIZE = 48
+
+
+def mm_to_px(mm: float, dpi: int) -> int:
+    return int(round(mm / 25.4 * dpi))
+
+
+def pt_to_px(pt: float, dpi: int) -> int:
+    return int(round(pt / 72 * dpi))
+
+
+def qr_matrix(serial: str) -> np.ndarray:
+    qr = qrcode.QRCode(border=2)
+    qr.add_data(serial)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def _scale(matrix: np.ndarray, height: int, width: int) -> np.ndarray:
+    rows = np.arange(height) * matrix.shape[0] // height
+    cols = np.arange(width) * matrix.shape[1] // width
+    return matrix[np.ix_(rows, cols)]
+
+
+def _fit_code(matrix: np.ndarray, side: int) -> np.ndarray:
+    modules = matrix.shape[0]
+    scale = side // modules
+    if scale == 0:
+        return _scale(matrix, side, side)
+    # Whole-pixel modules keep every module the same size, which scanners like.
+    return np.repeat(np.repeat(matrix, scale, axis=0), scale, axis=1)
+
+
+@lru_cache(maxsize=None)
+def _font() -> ImageFont.ImageFont:
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, _FONT_RENDER_SIZE)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def _glyph(char: str, height: int) -> np.ndarray:
+    # Each character is drawn with PIL once per size and then reused as an
+    # array for every serial on every page.
+    font = _font()
+    line_height = font.getbbox("Ag0")[3]
+    advance = max(1, int(math.ceil(font.getlength(char))))
+    image = Image.new("L", (advance, line_height), 0)
+    ImageDraw.Draw(image).text((0, 0), char, fill=255, font=font)
+    glyph = np.asarray(image) >= 128
+    width = max(1, advance * height // line_height)
+    return _scale(glyph, height, width)
+
+
+def text_matrix(text: str, height: int) -> np.ndarray:
+    if not text or height <= 0:
+        return np.zeros((max(height, 0), 0), dtype=bool)
+    return np.hstack([_glyph(char, height) for char in text])
+
+
+def _paste(page: np.ndarray, tile: np.ndarray, top: int, left: int) -> None:
+    bottom = min(page.shape[0], top + tile.shape[0])
+    right = min(page.shape[1], left + tile.shape[1])
+    top_clip = max(0, -top)
+    left_clip = max(0, -left)
+    top = max(0, top)
+    left = max(0, left)
+    if bottom <= top or right <= left:
+        return
+    page[top:bottom, left:right] |= tile[top_clip:top_clip + bottom - top, left_clip:left_clip + right - left]
+
+
+def page_size(dpi: int) -> Tuple[int, int]:
+    return mm_to_px(PAGE_WIDTH_MM, dpi), mm_to_px(PAGE_HEIGHT_MM, dpi)
+
+
+def render_page(serials: Sequence[str], sticker: StickerSize, dpi: int = DEFAULT_DPI) -> np.ndarray:
+    width, height = page_size(dpi)
+    page = np.zeros((height, width), dtype=bool)
+    sticker_width = mm_to_px(sticker.width, dpi)
+    sticker_height = mm_to_px(sticker.height, dpi)
+    margin_x = mm_to_px(sticker.margin_x, dpi)
+    margin_y = mm_to_px(sticker.margin_y, dpi)
+    text_height = pt_to_px(TEXT_HEIGHT_PT, dpi)
+    text_gap = pt_to_px(TEXT_GAP_PT, dpi)
+    side = min(sticker_width, sticker_height)
+
+    for idx, serial in enumerate(serials):
+        col_idx = idx % sticker.cols
+        row_idx = idx // sticker.cols
+        x = margin_x + col_idx * (sticker_width + margin_x)
+        y = margin_y + row_idx * (sticker_height + margin_y)
+
+        code = _fit_code(qr_matrix(serial), side)
+        _paste(
+            page,
+            code,
+            y + (sticker_height - code.shape[0]) // 2,
+            x + (sticker_width - code.shape[1]) // 2,
+        )
+        text = text_matrix(serial, text_height)[:, :sticker_width + margin_x]
+        _paste(page, text, y + sticker_height + text_gap, x + (sticker_width - text.shape[1]) // 2)
+    return page
+
+
+def _render_page_packed(serials: Sequence[str], sticker: StickerSize, dpi: int) -> bytes:
+    # Bit-packed with white as 1, the layout PIL expects for mode "1"; this is
+    # also 8x less data to send back from a pool process.
+    return np.packbits(~render_page(serials, sticker, dpi), axis=1).tobytes()
+
+
+def _pages(serials: Sequence[str], sticker: StickerSize) -> List[Sequence[str]]:
+    per_page = sticker.rows * sticker.cols
+    return [serials[start:start + per_page] for start in range(0, len(serials), per_page)]
+
+
+def iter_page_images(
+    serials: Sequence[str],
+    sticker: StickerSize,
+    dpi: int = DEFAULT_DPI,
+    workers: int = 1,
+) -> Iterator[Image.Image]:
+    # ``workers`` is the number of processes the caller may use, including
+    # itself; the runner grants it from its "jobs running at once" budget.
+    pages = _pages(serials, sticker)
+    size = page_size(dpi)
+    if workers <= 1 or len(pages) < PARALLEL_MIN_PAGES:
+        for page in pages:
+            yield Image.frombytes("1", size, _render_page_packed(page, sticker, dpi))
+        return
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(pages)),
+        mp_context=context,
+        # Pool processes exit on their own if this process is terminated.
+        initializer=exit_with_parent,
+        initargs=(os.getpid(), stop),
+    )
+    remaining = iter(pages)
+    pending = deque(
+        executor.submit(_render_page_packed, page, sticker, dpi)
+        for _, page in zip(range(workers * PAGES_AHEAD_PER_WORKER), remaining)
+    )
+    try:
+        while pending:
+            data = pending.popleft().result()
+            page = next(remaining, None)
+            if page is not None:
+                pending.append(executor.submit(_render_page_packed, page, sticker, dpi))
+            yield Image.frombytes("1", size, data)
+    finally:
+        # Ends the pool processes right away, so a cancelled export does not
+        # wait for the pages still being rendered.
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def raster_sheet_path(batch_id: int, sticker_name: str, extension: str = ".tif") -> str:
+    folder = ensure_batch_folder(batch_id)
+    return os.path.join(folder, f"{sticker_name.replace(' ', '_')}_sheet{extension}")
+
+
+def export_raster_sheet(
+    serials: Sequence[str],
+    sticker: StickerSize,
+    output_path: str,
+    dpi: int = DEFAULT_DPI,
+    on_page: Optional[Callable[[int], None]] = None,
+    workers: int = 1,
+) -> List[str]:
+    # closing() shuts the render pool down as soon as the export stops.
+    with closing(iter_page_images(serials, sticker, dpi, workers)) as images:
+        return _write_pages(images, output_path, dpi, on_page)
+
+
+def _write_pages(
+    images: Iterator[Image.Image], output_path: str, dpi: int, on_page: Optional[Callable[[int], None]]
+) -> List[str]:
+    stem, extension = os.path.splitext(output_path)
+    if extension.lower() == ".png":
+        paths = []
+        # The pages only replace their targets once all of them are written,
+        # so a cancelled export leaves no partial set of PNGs behind.
+        with ExitStack() as stack:
+            for number, image in enumerate(images, start=1):
+                path = f"{stem}_p{number:04d}.png"
+                temp_path = stack.enter_context(atomic_output(path))
+                image.save(temp_path, format="PNG", dpi=(dpi, dpi), optimize=True)
+                paths.append(path)
+                if on_page:
+                    on_page(number)
+        return paths
+
+    # Multi-page TIFF is appended one page at a time so that large batches
+    # never hold more than a single page in memory.
+    with atomic_output(output_path) as temp_path:
+        with TiffImagePlugin.AppendingTiffWriter(temp_path, True) as tiff:
+            for number, image in enumerate(images, start=1):
+                image.save(tiff, format="TIFF", compression="group4", dpi=(dpi, dpi))
+                tiff.newFrame()
+                if on_page:
+                    on_page(number)
+    return [output_path]
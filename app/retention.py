@@ -0,0 +1,165 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import database, thumbnails
+from .models import UNFINISHED_JOB_STATUSES, RetentionPolicy
+from .qr_utils import BATCHES_DIR, batch_folder, remove_stale_parts
+
+SETTING_MAX_AGE_DAYS = "retention_max_age_days"
+SETTING_MAX_TOTAL_MB = "retention_max_total_mb"
+
+
+def load_policy() -> RetentionPolicy:
+    return RetentionPolicy(
+        max_age_days=int(database.fetch_setting(SETTING_MAX_AGE_DAYS) or 0),
+        max_total_mb=int(database.fetch_setting(SETTING_MAX_TOTAL_MB) or 0),
+    )
+
+
+def save_policy(policy: RetentionPolicy) -> None:
+    database.save_setting(SETTING_MAX_AGE_DAYS, str(max(0, policy.max_age_days)))
+    database.save_setting(SETTING_MAX_TOTAL_MB, str(max(0, policy.max_total_mb)))
+
+
+def folder_size(path: str) -> int:
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    total += folder_size(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    value = size / 1024
+    for unit in ("KB", "MB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def batch_disk_usage() -> Dict[int, Tuple[int, int]]:
+    # Returns (asset files, database share) in bytes per batch. The database
+    # share splits the live database size by each batch's number of serials,
+    # which dominate its rows.
+    summaries = database.fetch_batch_summaries()
+    total_serials = sum(row["count"] for row in summaries) or 1
+    db_size = database.database_size()
+    return {
+        row["id"]: (folder_size(batch_folder(row["id"])), db_size * row["count"] // total_serials)
+        for row in summaries
+    }
+
+
+def _protected_batch_ids() -> List[int]:
+    return database.fetch_batch_ids_with_unfinished_jobs(UNFINISHED_JOB_STATUSES)
+
+
+def delete_batches(batch_ids: Sequence[int], progress: Optional[Callable[[str], None]] = None) -> Tuple[int, int]:
+    # Batches still being generated are skipped; cancelling the job removes them.
+    protected = set(_protected_batch_ids())
+    batch_ids = [batch_id for batch_id in batch_ids if batch_id not in protected]
+    if not batch_ids:
+        return 0, 0
+    size_before = database.database_size()
+    # Rows go first: a crash afterwards leaves only orphaned folders, which
+    # remove_orphan_folders() cleans up on the next retention run.
+    database.delete_batches(batch_ids)
+    freed = 0
+    for done, batch_id in enumerate(batch_ids, start=1):
+        folder = batch_folder(batch_id)
+        freed += folder_size(folder)
+        shutil.rmtree(folder, ignore_errors=True)
+        thumbnails.purge_batch(batch_id)
+        if progress:
+            progress(f"Removed files of {done}/{len(batch_ids)} batches")
+    database.compact()
+    freed += max(0, size_before - database.database_size())
+    return len(batch_ids), freed
+
+
+def remove_orphan_folders() -> int:
+    if not os.path.isdir(BATCHES_DIR):
+        return 0
+    # Batches may be created while the folders are scanned (by a generation job
+    # or the HTTP service). Their ids are above last_id, which is read before
+    # the known ids, so their fresh folders are never taken for orphans.
+    last_id = database.fetch_last_batch_id()
+    known = {row["id"] for row in database.fetch_batch_summaries()}
+    freed = 0
+    with os.scandir(BATCHES_DIR) as it:
+        for entry in it:
+            if not (entry.is_dir() and entry.name.isdigit()):
+                continue
+            batch_id = int(entry.name)
+            if batch_id <= last_id and batch_id not in known:
+                freed += folder_size(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                thumbnails.purge_batch(batch_id)
+    return freed
+
+
+def remove_stale_part_files() -> int:
+    # Exports killed mid-write (e.g. by closing the app) leave their temporary
+    # .part files behind.
+    if not os.path.isdir(BATCHES_DIR):
+        return 0
+    with os.scandir(BATCHES_DIR) as it:
+        batch_ids = [int(entry.name) for entry in it if entry.is_dir() and entry.name.isdigit()]
+    return sum(remove_stale_parts(batch_id) for batch_id in batch_ids)
+
+
+def select_expired(
+    policy: RetentionPolicy,
+    usage: Dict[int, Tuple[int, int]],
+    now: Optional[datetime] = None,
+) -> List[int]:
+    now = now or datetime.now()
+    protected = set(_protected_batch_ids())
+    # Oldest first, so the size limit removes the oldest batches first.
+    summaries = [row for row in database.fetch_batch_summaries() if row["id"] not in protected]
+    # The list keeps the deletion order; the set serves membership checks.
+    expired: List[int] = []
+    if policy.max_age_days > 0:
+        cutoff = now - timedelta(days=policy.max_age_days)
+        expired = [row["id"] for row in summaries if datetime.fromisoformat(row["created_at"]) < cutoff]
+    expired_ids = set(expired)
+    if policy.max_total_mb > 0:
+        limit = policy.max_total_mb * 1024 * 1024
+        total = sum(sum(sizes) for batch_id, sizes in usage.items() if batch_id not in expired_ids)
+        for row in summaries:
+            if total <= limit:
+                break
+            if row["id"] in expired_ids:
+                continue
+            expired.append(row["id"])
+            expired_ids.add(row["id"])
+            total -= sum(usage.get(row["id"], (0, 0)))
+    return expired
+
+
+def apply_retention(
+    policy: Optional[RetentionPolicy] = None, progress: Optional[Callable[[str], None]] = None
+) -> Tuple[int, int]:
+    policy = policy or load_policy()
+    freed = remove_orphan_folders() + remove_stale_part_files()
+    if not policy.enabled:
+        database.compact()
+        return 0, freed
+    if progress:
+        progress("Measuring batch disk usage...")
+    usage = batch_disk_usage() if policy.max_total_mb > 0 else {}
+    deleted, deleted_bytes = delete_batches(select_expired(policy, usage), progress)
+    if not deleted:
+        database.compact()
+    return deleted, freed + deleted_bytes
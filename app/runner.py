@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import batches, jobs, raster, retention, zpl
+from .models import RunnerTask
+from .processes import exit_with_parent
+from .qr_utils import export_qr_images
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_LABELS = {PRIORITY_HIGH: "High", PRIORITY_NORMAL: "Normal", PRIORITY_LOW: "Low"}
+# Cancelled generation tasks jump the queue so their cleanup runs in a worker.
+_PRIORITY_CANCELLED = -1
+
+TASK_QUEUED = "queued"
+TASK_RUNNING = "running"
+TASK_DONE = "done"
+TASK_FAILED = "failed"
+TASK_CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (TASK_DONE, TASK_FAILED, TASK_CANCELLED)
+
+TASK_GENERATE = "generate"
+TASK_EXPORT_PNGS = "export_pngs"
+TASK_EXPORT_SHEET = "export_sheet"
+TASK_EXPORT_ZPL = "export_zpl"
+TASK_PRINT_ZPL = "print_zpl"
+TASK_EXPORT_RASTER = "export_raster"
+TASK_DELETE_BATCHES = "delete_batches"
+TASK_APPLY_RETENTION = "apply_retention"
+# Tasks after which the batch list has changed.
+BATCH_CHANGING_TASKS = (TASK_GENERATE, TASK_DELETE_BATCHES, TASK_APPLY_RETENTION)
+# Tasks that can use more than one process. They get the number of slots
+# granted to them as an extra last argument before should_cancel.
+PARALLEL_TASKS = (TASK_EXPORT_RASTER,)
+
+DEFAULT_MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+
+def _run_generate(job_id: int, should_cancel: Callable[[], bool], progress: Callable[[str], None]) -> Optional[str]:
+    batch = jobs.run_job(job_id, should_cancel=should_cancel, progress=progress)
+    if batch is None:
+        return None
+    return f"Batch {batch.id} created with {batch.count} QR codes"
+
+
+def _run_export_pngs(batch_id: int, should_cancel: Callable[[], bool], progress: Callable[[str], None]) -> Optional[str]:
+    serials = batches.get_batch_serials(batch_id)
+
+    def on_image(done: int) -> None:
+        if should_cancel():
+            raise jobs.JobCancelled()
+        if done % jobs.PNG_CHECKPOINT_INTERVAL == 0 or done == len(serials):
+            progress(f"Rendered {done}/{len(serials)} QR images")
+
+    try:
+        folder = export_qr_images(batch_id, serials, on_image=on_image)
+    except jobs.JobCancelled:
+        return None
+    return f"QR images saved to:\n{folder}"
+
+
+def _run_export_sheet(batch_id: int, should_cancel: Callable[[], bool], progress: Callable[[str], None]) -> Optional[str]:
+    def on_page(pages: int) -> None:
+        if should_cancel():
+            raise jobs.JobCancelled()
+        progress(f"Wrote {pages} PDF pages")
+
+    try:
+        pdf = batches.export_batch_sheet(batch_id, on_page=on_page)
+    except jobs.JobCancelled:
+        return None
+    return f"Sticker sheet saved to:\n{pdf}"
+
+
+def _load_batch_layout(batch_id: int):
+    sticker = batches.load_batch_sticker(batch_id)
+    if not sticker:
+        raise ValueError("The sticker size of this batch no longer exists")
+    return batches.get_batch_serials(batch_id), sticker
+
+
+def _run_export_zpl(
+    batch_id: int, dpi: int, should_cancel: Callable[[], bool], progress: Callable[[str], None]
+) -> Optional[str]:
+    serials, sticker = _load_batch_layout(batch_id)
+
+    def on_chunk(written: int) -> None:
+        if should_cancel():
+            raise jobs.JobCancelled()
+        progress(f"Wrote {written // 1024} KiB of ZPL")
+
+    try:
+        path = zpl.export_zpl(batch_id, serials, sticker, dpi, on_chunk=on_chunk)
+    except jobs.JobCancelled:
+        return None
+    return f"ZPL labels saved to:\n{path}"
+
+
+def _run_print_zpl(
+    batch_id: int,
+    host: str,
+    port: int,
+    dpi: int,
+    should_cancel: Callable[[], bool],
+    progress: Callable[[str], None],
+) -> Optional[str]:
+    serials, sticker = _load_batch_layout(batch_id)
+
+    def on_chunk(sent: int) -> None:
+        if should_cancel():
+            raise jobs.JobCancelled()
+        progress(f"Sent {sent // 1024} KiB to {host}:{port}")
+
+    try:
+        sent = zpl.send_zpl(zpl.iter_chunks(zpl.iter_batch_zpl(serials, sticker, dpi)), host, port, on_chunk=on_chunk)
+    except jobs.JobCancelled:
+        return None
+    return f"Sent {len(serials)} labels ({sent // 1024} KiB) to {host}:{port}"
+
+
+def _run_export_raster(
+    batch_id: int,
+    output_path: str,
+    dpi: int,
+    workers: int,
+    should_cancel: Callable[[], bool],
+    progress: Callable[[str], None],
+) -> Optional[str]:
+    serials, sticker = _load_batch_layout(batch_id)
+
+    def on_page(pages: int) -> None:
+        if should_cancel():
+            raise jobs.JobCancelled()
+        progress(f"Rendered {pages} raster pages")
+
+    try:
+        paths = raster.export_raster_sheet(serials, sticker, output_path, dpi, on_page=on_page, workers=workers)
+    except jobs.JobCancelled:
+        return None
+    if len(paths) == 1:
+        return f"Raster sheet saved to:\n{paths[0]}"
+    return f"{len(paths)} raster pages saved to:\n{os.path.dirname(paths[0])}"
+
+
+# Deletion cannot be cancelled half-way: once the rows are gone the files
+# must go too, so should_cancel is ignored by the two tasks below.
+def _run_delete_batches(
+    batch_ids: Tuple[int, ...], should_cancel: Callable[[], bool], progress: Callable[[str], None]
+) -> Optional[str]:
+    deleted, freed = retention.delete_batches(batch_ids, progress)
+    skipped = len(batch_ids) - deleted
+    message = f"Deleted {deleted} batch(es), freed {retention.format_size(freed)}"
+    if skipped:
+        message += f"; {skipped} still generating were kept"
+    return message
+
+
+def _run_apply_retention(should_cancel: Callable[[], bool], progress: Callable[[str], None]) -> Optional[str]:
+    deleted, freed = retention.apply_retention(progress=progress)
+    return f"Retention removed {deleted} batch(es), freed {retention.format_size(freed)}"
+
+
+TASK_FUNCTIONS = {
+    TASK_GENERATE: _run_generate,
+    TASK_EXPORT_PNGS: _run_export_pngs,
+    TASK_EXPORT_SHEET: _run_export_sheet,
+    TASK_EXPORT_ZPL: _run_export_zpl,
+    TASK_PRINT_ZPL: _run_print_zpl,
+    TASK_EXPORT_RASTER: _run_export_raster,
+    TASK_DELETE_BATCHES: _run_delete_batches,
+    TASK_APPLY_RETENTION: _run_apply_retention,
+}
+
+
+def _worker_main(task_id: int, kind: str, args: Tuple, events, cancel_event, parent_pid: int) -> None:
+    exit_with_parent(parent_pid)
+
+    def progress(message: str) -> None:
+        events.put((task_id, TASK_RUNNING, message))
+
+    try:
+        result = TASK_FUNCTIONS[kind](*args, cancel_event.is_set, progress)
+    except Exception as exc:
+        events.put((task_id, TASK_FAILED, str(exc)))
+        return
+    if result is None:
+        events.put((task_id, TASK_CANCELLED, "Cancelled"))
+    else:
+        events.put((task_id, TASK_DONE, result))
+
+
+# Tasks wait in a priority queue and start whenever fewer than max_workers
+# slots are busy. A task normally takes one slot; a parallel task also takes
+# the slots no queued task is waiting for, and keeps them until it ends.
+# Workers report progress over a shared multiprocessing queue; the owner calls
+# poll() periodically (the UI does so from the Tk event loop) to start queued
+# work and collect updates.
+class JobRunner:
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        # Spawned workers do not inherit the Tk interpreter state of the parent.
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._queue: List[Tuple[int, int, int]] = []
+        self._counter = itertools.count()
+        self._ids = itertools.count(1)
+        self._args: Dict[int, Tuple] = {}
+        self._cancel_events: Dict[int, object] = {}
+        self._processes: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._slots: Dict[int, int] = {}
+        self.tasks: Dict[int, RunnerTask] = {}
+        self.max_workers = max(1, max_workers)
+
+    def submit(self, kind: str, args: Tuple, label: str, priority: int = PRIORITY_NORMAL) -> RunnerTask:
+        task = RunnerTask(id=next(self._ids), kind=kind, label=label, priority=priority, status=TASK_QUEUED)
+        self.tasks[task.id] = task
+        self._args[task.id] = args
+        self._cancel_events[task.id] = self._context.Event()
+        heapq.heappush(self._queue, (priority, next(self._counter), task.id))
+        return task
+
+    def cancel(self, task_id: int) -> None:
+        task = self.tasks.get(task_id)
+        if not task or task.status in FINISHED_STATUSES:
+            return
+        self._cancel_events[task_id].set()
+        cleaned_up = True
+        if task.kind == TASK_GENERATE:
+            cleaned_up = jobs.request_cancel(self._args[task_id][0])
+        if task.status != TASK_QUEUED:
+            task.message = "Cancelling..."
+            return
+        if not cleaned_up:
+            # A queued generation job may already own a partial batch from an
+            # earlier run; dispatching it lets the worker clean that up.
+            task.message = "Cancelling..."
+            heapq.heappush(self._queue, (_PRIORITY_CANCELLED, next(self._counter), task_id))
+        else:
+            task.status = TASK_CANCELLED
+            task.message = "Cancelled"
+
+    def set_max_workers(self, max_workers: int) -> None:
+        self.max_workers = max(1, max_workers)
+
+    @property
+    def active_count(self) -> int:
+        return len(self._processes)
+
+    @property
+    def busy_slots(self) -> int:
+        return sum(self._slots.values())
+
+    def poll(self) -> List[RunnerTask]:
+        updated: Dict[int, RunnerTask] = {}
+        exited = [task_id for task_id, proc in self._processes.items() if not proc.is_alive()]
+        while True:
+            try:
+                task_id, status, message = self._events.get_nowait()
+            except queue.Empty:
+                break
+            task = self.tasks[task_id]
+            task.status = status
+            task.message = message
+            updated[task_id] = task
+        for task_id in exited:
+            self._processes.pop(task_id).join()
+            self._slots.pop(task_id, None)
+            task = self.tasks[task_id]
+            if task.status not in FINISHED_STATUSES:
+                task.status = TASK_FAILED
+                task.message = "Worker exited unexpectedly"
+                updated[task_id] = task
+        for task in self._start_queued():
+            updated[task.id] = task
+        return list(updated.values())
+
+    def _start_queued(self) -> List[RunnerTask]:
+        started: List[RunnerTask] = []
+        while self._queue and self.busy_slots < self.max_workers:
+            _, _, task_id = heapq.heappop(self._queue)
+            task = self.tasks[task_id]
+            if task.status != TASK_QUEUED or task_id in self._processes:
+                continue
+            args = self._args[task_id]
+            slots = 1
+            if task.kind in PARALLEL_TASKS:
+                slots = max(1, self.max_workers - self.busy_slots - self._waiting_count())
+                args = args + (slots,)
+            proc = self._context.Process(
+                target=_worker_main,
+                args=(task_id, task.kind, args, self._events, self._cancel_events[task_id], os.getpid()),
+                # Not daemonic, as daemonic processes cannot start the page
+                # render pool. Workers exit with the app via exit_with_parent().
+                daemon=False,
+            )
+            proc.start()
+            self._processes[task_id] = proc
+            self._slots[task_id] = slots
+            task.status = TASK_RUNNING
+            task.message = task.message or "Starting..."
+            started.append(task)
+        return started
+
+    def _waiting_count(self) -> int:
+        return len({task_id for _, _, task_id in self._queue if self.tasks[task_id].status == TASK_QUEUED})
+
+    def shutdown(self) -> None:
+        # Generation jobs are checkpointed, so terminated workers simply resume
+        # on the next launch.
+        for proc in self._processes.values():
+            proc.terminate()
+        for proc in self._processes.values():
+            proc.join()
+        self._processes.clear()
+        self._slots.clear()
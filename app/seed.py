@@ -10,13 +10,23 @@ from .serials import generate_unique_serials
 
 SAMPLE_BATCH_NAME = "Demo Batch"
 SAMPLE_COUNT = 6
+SETTING_DEMO_SEEDED = "demo_batch_seeded"
 
 
 def ensure_seed_data() -> None:
     database.init_db()
     database.seed_sticker_sizes()
-    if database.fetch_batches():
+    # The demo batch is only created once, so a history the user (or the
+    # retention policy) has emptied stays empty. Databases from before this
+    # setting count as seeded if they ever held a batch.
+    if database.fetch_setting(SETTING_DEMO_SEEDED):
         return
+    if not database.fetch_last_batch_id():
+        _create_demo_batch()
+    database.save_setting(SETTING_DEMO_SEEDED, "1")
+
+
+def _create_demo_batch() -> None:
     sticker = batches.list_sticker_sizes()[0]
     serials = generate_unique_serials(SAMPLE_COUNT)
     batch = batches.create_batch(SAMPLE_BATCH_NAME, sticker.id, serials)
@@ -0,0 +1,443 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from http import HTTPStatus
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from . import batches, database
+from .layout import sheet_filename
+from .models import Batch
+from .qr_utils import codes_zip_filename, export_qr_zip, render_qr_png
+from .serials import generate_unique_serials
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+CSV_ROWS_PER_CHUNK = 2000
+QR_CACHE_SIZE = 4096
+MAX_BOX_SIZE = 40
+HTTP_1_0 = "HTTP/1.0"
+HTTP_1_1 = "HTTP/1.1"
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method: str, target: str, version: str, headers: Dict[str, str], body: bytes) -> None:
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        # HTTP/1.0 closes the connection unless the client asks otherwise.
+        if self.version == HTTP_1_0:
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def accepts_chunked(self) -> bool:
+        return self.version != HTTP_1_0
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        return data
+
+
+class Response:
+    def __init__(
+        self,
+        status: HTTPStatus = HTTPStatus.OK,
+        content_type: str = "application/json",
+        body: bytes = b"",
+        chunks: Optional[AsyncIterator[bytes]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.chunks = chunks
+        self.headers = headers or {}
+        # Runs once the response has been written or the client went away.
+        self.on_close = on_close
+
+
+def json_response(data, status: HTTPStatus = HTTPStatus.OK) -> Response:
+    return Response(status=status, body=json.dumps(data).encode("utf-8"))
+
+
+def batch_to_dict(batch: Batch) -> dict:
+    return {
+        "id": batch.id,
+        "name": batch.name,
+        "created_at": batch.created_at.isoformat(),
+        "sticker_name": batch.sticker_name,
+        "count": batch.count,
+    }
+
+
+# The functions below run inside the worker pool, so they only take and
+# return picklable values.
+
+
+def _create_batch(name: str, sticker_size_id: int, count: int) -> Batch:
+    return batches.create_batch(name, sticker_size_id, generate_unique_serials(count))
+
+
+def _build_sheet(batch_id: int, output_path: str) -> str:
+    return batches.export_batch_sheet(batch_id, output_path=output_path)
+
+
+def _build_codes_zip(batch_id: int, output_path: str) -> str:
+    return export_qr_zip(batch_id, batches.get_batch_serials(batch_id), output_path=output_path)
+
+
+Handler = Callable[["QRService", Request, re.Match], Awaitable[Response]]
+
+
+class QRService:
+    def __init__(self, executor: Executor) -> None:
+        self.executor = executor
+        self._qr_cache: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.routes: List[Tuple[str, re.Pattern, Handler]] = [
+            ("GET", re.compile(r"^/health$"), QRService.health),
+            ("GET", re.compile(r"^/sticker-sizes$"), QRService.list_sticker_sizes),
+            ("GET", re.compile(r"^/batches$"), QRService.list_batches),
+            ("POST", re.compile(r"^/batches$"), QRService.create_batch),
+            ("GET", re.compile(r"^/batches/(\d+)$"), QRService.get_batch),
+            ("GET", re.compile(r"^/batches/(\d+)/serials\.csv$"), QRService.export_csv),
+            ("GET", re.compile(r"^/batches/(\d+)/sheet\.pdf$"), QRService.export_pdf),
+            ("GET", re.compile(r"^/batches/(\d+)/codes\.zip$"), QRService.export_pngs),
+            ("GET", re.compile(r"^/qr/(.+)\.png$"), QRService.render_code),
+        ]
+
+    async def run_in_pool(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run_in_thread(self, func, *args):
+        # SQLite calls block, so even short reads are kept off the event loop.
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def health(self, request: Request, match: re.Match) -> Response:
+        return json_response({"status": "ok"})
+
+    async def list_sticker_sizes(self, request: Request, match: re.Match) -> Response:
+        stickers = await self.run_in_thread(batches.list_sticker_sizes)
+        return json_response([vars(sticker) for sticker in stickers])
+
+    async def list_batches(self, request: Request, match: re.Match) -> Response:
+        saved = await self.run_in_thread(batches.list_batches)
+        return json_response([batch_to_dict(batch) for batch in saved])
+
+    async def create_batch(self, request: Request, match: re.Match) -> Response:
+        data = request.json()
+        try:
+            count = int(data.get("count", 0))
+            sticker_size_id = int(data.get("sticker_size_id", 0))
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "count and sticker_size_id must be integers")
+        if count <= 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "count must be positive")
+        stickers = await self.run_in_thread(batches.list_sticker_sizes)
+        if not any(sticker.id == sticker_size_id for sticker in stickers):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown sticker size {sticker_size_id}")
+        name = str(data.get("name") or "").strip() or f"API batch ({count} codes)"
+        batch = await self.run_in_pool(_create_batch, name, sticker_size_id, count)
+        return json_response(batch_to_dict(batch), status=HTTPStatus.CREATED)
+
+    async def get_batch(self, request: Request, match: re.Match) -> Response:
+        return json_response(batch_to_dict(await self._load_batch(match)))
+
+    async def export_csv(self, request: Request, match: re.Match) -> Response:
+        batch = await self._load_batch(match)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(["batch_id", "batch_name", "created_at", "sticker_size", "serial"])
+            created_at = batch.created_at.isoformat(sep=" ")
+            # Serials are read one page at a time, so only a single chunk of a
+            # large batch is ever held in memory.
+            last_id = 0
+            while True:
+                rows = await self.run_in_thread(
+                    database.fetch_serial_page, batch.id, last_id, CSV_ROWS_PER_CHUNK
+                )
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                writer.writerows(
+                    (batch.id, batch.name, created_at, batch.sticker_name, row["serial"]) for row in rows
+                )
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue().encode("utf-8")
+
+        return Response(
+            content_type="text/csv; charset=utf-8",
+            chunks=chunks(),
+            headers=_attachment(f"batch_{batch.id}.csv"),
+        )
+
+    async def export_pdf(self, request: Request, match: re.Match) -> Response:
+        batch = await self._load_batch(match)
+        path = _temp_export_path(".pdf")
+        try:
+            await self.run_in_pool(_build_sheet, batch.id, path)
+        except ValueError as exc:
+            _remove_file(path)
+            raise HTTPError(HTTPStatus.CONFLICT, str(exc))
+        except BaseException:
+            _remove_file(path)
+            raise
+        return _temp_file_response(path, "application/pdf", sheet_filename(batch.sticker_name))
+
+    async def export_pngs(self, request: Request, match: re.Match) -> Response:
+        batch = await self._load_batch(match)
+        path = _temp_export_path(".zip")
+        try:
+            await self.run_in_pool(_build_codes_zip, batch.id, path)
+        except BaseException:
+            _remove_file(path)
+            raise
+        return _temp_file_response(path, "application/zip", codes_zip_filename(batch.id))
+
+    async def render_code(self, request: Request, match: re.Match) -> Response:
+        data = unquote(match.group(1))
+        try:
+            box_size = int(request.query.get("box_size", 10))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "box_size must be an integer")
+        if not 1 <= box_size <= MAX_BOX_SIZE:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"box_size must be between 1 and {MAX_BOX_SIZE}")
+        key = (data, box_size)
+        png = self._qr_cache.get(key)
+        if png is None:
+            png = await self.run_in_pool(render_qr_png, data, box_size)
+            self._qr_cache[key] = png
+            if len(self._qr_cache) > QR_CACHE_SIZE:
+                self._qr_cache.popitem(last=False)
+        else:
+            self._qr_cache.move_to_end(key)
+        return Response(content_type="image/png", body=png)
+
+    async def _load_batch(self, match: re.Match) -> Batch:
+        batch = await self.run_in_thread(batches.load_batch, int(match.group(1)))
+        if not batch:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Batch not found")
+        return batch
+
+    async def dispatch(self, request: Request) -> Response:
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            return await handler(self, request, match)
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Not found")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                try:
+                    response = await self.dispatch(request)
+                except HTTPError as exc:
+                    response = json_response({"error": exc.message}, status=exc.status)
+                except Exception as exc:
+                    response = json_response({"error": str(exc)}, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+                # HTTP/1.0 clients cannot parse chunked bodies, so a streamed
+                # response is sent as-is and its end marked by closing.
+                chunked = request.accepts_chunked
+                keep_alive = request.keep_alive and (chunked or response.chunks is None)
+                await _write_response(writer, response, keep_alive, chunked)
+                if not keep_alive:
+                    break
+        except HTTPError as exc:
+            await _write_response(writer, json_response({"error": exc.message}, status=exc.status), False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as exc:
+        if exc.partial.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    version = version.strip().upper()
+    if version not in (HTTP_1_0, HTTP_1_1):
+        raise HTTPError(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED, "Only HTTP/1.0 and HTTP/1.1 are supported")
+    headers: Dict[str, str] = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    length_header = headers.get("content-length", "") or "0"
+    if not (length_header.isascii() and length_header.isdigit()):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length header")
+    length = int(length_header)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target, version, headers, body)
+
+
+async def _write_response(
+    writer: asyncio.StreamWriter, response: Response, keep_alive: bool, chunked: bool = True
+) -> None:
+    headers = {
+        "Content-Type": response.content_type,
+        "Connection": "keep-alive" if keep_alive else "close",
+        **response.headers,
+    }
+    if response.chunks is None:
+        headers["Content-Length"] = str(len(response.body))
+    elif chunked:
+        headers["Transfer-Encoding"] = "chunked"
+    status = response.status
+    lines = [f"{HTTP_1_1} {status.value} {status.phrase}"]
+    lines.extend(f"{key}: {value}" for key, value in headers.items())
+    try:
+        await _write_body(writer, response, lines, chunked)
+    finally:
+        if response.chunks is not None:
+            await response.chunks.aclose()
+        if response.on_close:
+            response.on_close()
+
+
+async def _write_body(writer: asyncio.StreamWriter, response: Response, lines: List[str], chunked: bool) -> None:
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    if response.chunks is None:
+        writer.write(response.body)
+    else:
+        async for chunk in response.chunks:
+            if chunk:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                # Waiting for the socket buffer to drain keeps memory bounded
+                # for slow clients and yields to other connections.
+                await writer.drain()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+def _attachment(filename: str) -> Dict[str, str]:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+def _temp_export_path(suffix: str) -> str:
+    # Every request builds its own copy: rebuilding a shared file in the batch
+    # folder would fail on Windows while another client is still reading it.
+    handle, path = tempfile.mkstemp(prefix="qr_export_", suffix=suffix)
+    os.close(handle)
+    return path
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _temp_file_response(path: str, content_type: str, filename: str) -> Response:
+    async def chunks() -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as handle:
+            while True:
+                chunk = await loop.run_in_executor(None, handle.read, STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(
+        content_type=content_type,
+        chunks=chunks(),
+        headers=_attachment(filename),
+        on_close=lambda: _remove_file(path),
+    )
+
+
+async def start_service(
+    host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, executor: Optional[Executor] = None
+) -> Tuple[asyncio.AbstractServer, QRService]:
+    database.init_db()
+    database.seed_sticker_sizes()
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=DEFAULT_WORKERS)
+    service = QRService(executor)
+    server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    return server, service
+
+
+async def serve(host: str, port: int, workers: int) -> None:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        server, _ = await start_service(host, port, executor)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Serving QR service on {addresses} with {workers} worker(s)")
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local HTTP service for QR batch generation and export.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, max(1, args.workers)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from . import batches, database
+from .models import StickerSize
+from .qr_utils import atomic_output
+from .raster import page_size, qr_matrix, render_page, text_matrix
+
+THUMBNAIL_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "thumbnails")
+# Bump when the rendering changes so stale thumbnails are not reused.
+THUMBNAIL_VERSION = 1
+# The page is rendered at RENDER_DPI and averaged down by DOWNSAMPLE, which
+# gives a ~250px wide grey-scale A4 preview that still shows the code pattern.
+RENDER_DPI = 90
+DOWNSAMPLE = 3
+SAMPLE_COUNT = 3
+SAMPLE_MODULE_PX = 2
+SAMPLE_TEXT_PX = 10
+SAMPLE_GAP_PX = 12
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(batch_id: int, sticker: StickerSize) -> str:
+    params = (
+        THUMBNAIL_VERSION,
+        sticker.width,
+        sticker.height,
+        sticker.margin_x,
+        sticker.margin_y,
+        sticker.rows,
+        sticker.cols,
+    )
+    digest = hashlib.sha1(repr(params).encode("utf-8")).hexdigest()[:16]
+    # The batch id leads the file name so a batch's thumbnails can be found
+    # (and purged) without knowing its sticker parameters.
+    return f"{batch_id}_{digest}"
+
+
+def thumbnail_paths(batch_id: int, sticker: StickerSize) -> Tuple[str, str]:
+    key = cache_key(batch_id, sticker)
+    return (
+        os.path.join(THUMBNAIL_DIR, f"{key}_page.png"),
+        os.path.join(THUMBNAIL_DIR, f"{key}_samples.png"),
+    )
+
+
+def cached_thumbnails(batch_id: int, sticker: StickerSize) -> Optional[Tuple[str, str]]:
+    paths = thumbnail_paths(batch_id, sticker)
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    # Touching the files keeps recently viewed batches at the back of the
+    # eviction order. evict() may remove them at any moment from the render
+    # process, which then simply counts as a cache miss.
+    try:
+        for path in paths:
+            os.utime(path)
+    except FileNotFoundError:
+        return None
+    return paths
+
+
+def _to_image(dark: np.ndarray) -> Image.Image:
+    return Image.fromarray(((1.0 - dark) * 255).astype(np.uint8))
+
+
+def render_page_thumbnail(serials: List[str], sticker: StickerSize) -> Image.Image:
+    page = render_page(serials, sticker, RENDER_DPI)
+    width, height = page_size(RENDER_DPI)
+    height -= height % DOWNSAMPLE
+    width -= width % DOWNSAMPLE
+    # Box-filter by averaging each DOWNSAMPLE x DOWNSAMPLE block.
+    blocks = page[:height, :width].reshape(height // DOWNSAMPLE, DOWNSAMPLE, width // DOWNSAMPLE, DOWNSAMPLE)
+    return _to_image(blocks.mean(axis=(1, 3)))
+
+
+def render_samples(serials: List[str]) -> Image.Image:
+    tiles = []
+    for serial in serials[:SAMPLE_COUNT]:
+        code = qr_matrix(serial)
+        code = np.repeat(np.repeat(code, SAMPLE_MODULE_PX, axis=0), SAMPLE_MODULE_PX, axis=1)
+        text = text_matrix(serial, SAMPLE_TEXT_PX)
+        width = max(code.shape[1], text.shape[1])
+        tile = np.zeros((code.shape[0] + SAMPLE_TEXT_PX + 4, width + SAMPLE_GAP_PX), dtype=bool)
+        left = (width - code.shape[1]) // 2
+        tile[:code.shape[0], left:left + code.shape[1]] = code
+        left = (width - text.shape[1]) // 2
+        tile[code.shape[0] + 2:code.shape[0] + 2 + SAMPLE_TEXT_PX, left:left + text.shape[1]] = text
+        tiles.append(tile)
+    if not tiles:
+        return _to_image(np.zeros((1, 1)))
+    height = max(tile.shape[0] for tile in tiles)
+    strip = np.hstack([np.pad(tile, ((0, height - tile.shape[0]), (0, 0))) for tile in tiles])
+    return _to_image(strip.astype(float))
+
+
+def _save_png(image: Image.Image, path: str) -> None:
+    with atomic_output(path) as temp_path:
+        image.save(temp_path, format="PNG")
+
+
+def build_thumbnails(batch_id: int) -> Optional[Tuple[str, str]]:
+    sticker = batches.load_batch_sticker(batch_id)
+    if not sticker:
+        return None
+    cached = cached_thumbnails(batch_id, sticker)
+    if cached:
+        return cached
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    serials = database.fetch_serials(batch_id, limit=sticker.rows * sticker.cols)
+    page_path, samples_path = thumbnail_paths(batch_id, sticker)
+    _save_png(render_page_thumbnail(serials, sticker), page_path)
+    _save_png(render_samples(serials), samples_path)
+    evict(MAX_CACHE_BYTES)
+    return page_path, samples_path
+
+
+def evict(max_bytes: int) -> None:
+    entries = []
+    with os.scandir(THUMBNAIL_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def purge_batch(batch_id: int) -> None:
+    if not os.path.isdir(THUMBNAIL_DIR):
+        return
+    prefix = f"{batch_id}_"
+    with os.scandir(THUMBNAIL_DIR) as it:
+        for entry in it:
+            if entry.name.startswith(prefix):
+                # evict() in the render process may have removed it already.
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+
+
+# Renders thumbnails in a separate process: QR encoding is pure Python and
+# would otherwise hold the GIL of the Tk process for ~100ms per batch. A
+# background thread hands requests to it and waits for the result. Only the
+# most recent request is kept: when the user scrolls through the history
+# quickly, previews for rows already left behind are never rendered.
+class ThumbnailWorker:
+    def __init__(self) -> None:
+        self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self._requests: "queue.Queue[Optional[Tuple[int, Callable]]]" = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, batch_id: int, callback: Callable[[int, Optional[Tuple[str, str]], Optional[str]], None]) -> None:
+        self._replace_request((batch_id, callback))
+
+    def shutdown(self) -> None:
+        self._replace_request(None)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _replace_request(self, item: Optional[Tuple[int, Callable]]) -> None:
+        try:
+            self._requests.get_nowait()
+        except queue.Empty:
+            pass
+        self._requests.put(item)
+
+    def _run(self) -> None:
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            batch_id, callback = item
+            try:
+                paths = self._executor.submit(build_thumbnails, batch_id).result()
+            except Exception as exc:
+                callback(batch_id, None, str(exc))
+            else:
+                callback(batch_id, paths, None)
@@ -1,14 +1,14 @@
 import os
 import threading
 from datetime import datetime
-from tkinter import END, LEFT, RIGHT, BOTH, filedialog, messagebox, ttk, Tk, StringVar
-from typing import List, Optional
+from tkinter import END, LEFT, RIGHT, BOTH, PhotoImage, TclError, Toplevel, filedialog, messagebox, simpledialog, ttk, Tk, StringVar
+from typing import Dict, List, Optional, Tuple
 
-from . import batches, database
-from .layout import export_sheet
-from .models import Batch, StickerSize
-from .qr_utils import export_qr_images
-from .serials import generate_unique_serials
+from . import batches, database, jobs, raster, retention, runner, thumbnails, zpl
+from .models import Batch, RetentionPolicy, RunnerTask, StickerSize
+
+# How often the Tk loop collects progress from the worker processes.
+RUNNER_POLL_MS = 100
 
 
 class QRApp:
@@ -25,6 +25,11 @@ class QRApp:
 
         self.progress = StringVar()
         self.progress.set("Ready")
+        self.runner = runner.JobRunner()
+        self.printer_address = ""
+        self.printer_dpi = zpl.DEFAULT_DPI
+        self.thumbnail_worker = thumbnails.ThumbnailWorker()
+        self.preview_images: List[PhotoImage] = []
 
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=BOTH, expand=True)
@@ -41,6 +46,11 @@ class QRApp:
         self._build_history_tab()
 
         self.refresh_history()
+        self._resume_unfinished_jobs()
+        if retention.load_policy().enabled:
+            self._submit_task(runner.TASK_APPLY_RETENTION, (), "Apply retention policy", runner.PRIORITY_LOW)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(RUNNER_POLL_MS, self._poll_runner)
 
     def _build_generate_tab(self) -> None:
         frame = self.generate_tab
@@ -63,14 +73,50 @@ class QRApp:
         if self.sticker_sizes:
             self.sticker_dropdown.current(0)
 
+        ttk.Label(frame, text="Priority:").grid(row=3, column=0, sticky="w", pady=(8, 0))
+        self.priority_dropdown = ttk.Combobox(
+            frame,
+            state="readonly",
+            values=list(runner.PRIORITY_LABELS.values()),
+        )
+        self.priority_dropdown.grid(row=3, column=1, sticky="w", pady=(8, 0))
+        self.priority_dropdown.current(runner.PRIORITY_NORMAL)
+
+        ttk.Label(frame, text="Jobs running at once:").grid(row=4, column=0, sticky="w", pady=(8, 0))
+        self.max_workers_var = StringVar(value=str(self.runner.max_workers))
+        workers_spinbox = ttk.Spinbox(
+            frame,
+            from_=1,
+            to=os.cpu_count() or 1,
+            textvariable=self.max_workers_var,
+            command=self.on_max_workers_change,
+            width=5,
+        )
+        workers_spinbox.grid(row=4, column=1, sticky="w", pady=(8, 0))
+        workers_spinbox.bind("<Return>", self.on_max_workers_change)
+        workers_spinbox.bind("<FocusOut>", self.on_max_workers_change)
+
         self.generate_button = ttk.Button(frame, text="Generate QR Codes", command=self.handle_generate)
-        self.generate_button.grid(row=3, column=0, columnspan=2, pady=(16, 8), sticky="w")
+        self.generate_button.grid(row=5, column=0, pady=(16, 8), sticky="w")
+        self.cancel_button = ttk.Button(frame, text="Cancel selected job", command=self.handle_cancel, state="disabled")
+        self.cancel_button.grid(row=5, column=1, pady=(16, 8), sticky="w")
 
         self.progress_label = ttk.Label(frame, textvariable=self.progress)
-        self.progress_label.grid(row=4, column=0, columnspan=2, sticky="w")
+        self.progress_label.grid(row=6, column=0, columnspan=2, sticky="w")
+
+        columns = ("ID", "Job", "Priority", "Status", "Progress")
+        self.jobs_tree = ttk.Treeview(frame, columns=columns, show="headings", height=8)
+        for col in columns:
+            self.jobs_tree.heading(col, text=col)
+        self.jobs_tree.column("ID", width=40, stretch=False)
+        self.jobs_tree.column("Priority", width=70, stretch=False)
+        self.jobs_tree.column("Status", width=80, stretch=False)
+        self.jobs_tree.grid(row=7, column=0, columnspan=2, sticky="nsew", pady=(8, 0))
+        self.jobs_tree.bind("<<TreeviewSelect>>", self.on_job_select)
 
         for i in range(2):
             frame.columnconfigure(i, weight=1)
+        frame.rowconfigure(7, weight=1)
 
     def _build_sizes_tab(self) -> None:
         frame = self.sizes_tab
@@ -119,13 +165,24 @@ class QRApp:
 
     def _build_history_tab(self) -> None:
         frame = self.history_tab
-        columns = ("ID", "Name", "Created", "Count", "Sticker")
-        self.history_tree = ttk.Treeview(frame, columns=columns, show="headings", height=14)
+        top = ttk.Frame(frame)
+        top.pack(fill=BOTH, expand=True)
+        columns = ("ID", "Name", "Created", "Count", "Sticker", "Disk")
+        self.history_tree = ttk.Treeview(top, columns=columns, show="headings", height=14)
         for col in columns:
             self.history_tree.heading(col, text=col)
-        self.history_tree.pack(fill=BOTH, expand=True)
+        self.history_tree.pack(side=LEFT, fill=BOTH, expand=True)
         self.history_tree.bind("<<TreeviewSelect>>", self.on_batch_select)
 
+        preview = ttk.LabelFrame(top, text="Preview", padding=8)
+        preview.pack(side=RIGHT, fill="y", padx=(12, 0))
+        self.preview_status = StringVar(value="Select a batch to preview it")
+        ttk.Label(preview, textvariable=self.preview_status).pack(anchor="w")
+        self.preview_page_label = ttk.Label(preview)
+        self.preview_page_label.pack(pady=(8, 0))
+        self.preview_samples_label = ttk.Label(preview)
+        self.preview_samples_label.pack(pady=(8, 0))
+
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(fill="x", pady=8)
         self.export_qr_btn = ttk.Button(btn_frame, text="Export QR images", command=self.export_selected_qrs, state="disabled")
@@ -134,6 +191,20 @@ class QRApp:
         self.export_qr_btn.pack(side=LEFT, padx=(0, 6))
         self.export_pdf_btn.pack(side=LEFT, padx=(0, 6))
         self.export_csv_btn.pack(side=LEFT, padx=(0, 6))
+        self.export_zpl_btn = ttk.Button(btn_frame, text="Export ZPL labels", command=self.export_selected_zpl, state="disabled")
+        self.print_zpl_btn = ttk.Button(btn_frame, text="Send to label printer", command=self.print_selected_zpl, state="disabled")
+        self.export_zpl_btn.pack(side=LEFT, padx=(0, 6))
+        self.print_zpl_btn.pack(side=LEFT, padx=(0, 6))
+        self.export_raster_btn = ttk.Button(btn_frame, text="Export raster sheet", command=self.export_selected_raster, state="disabled")
+        self.export_raster_btn.pack(side=LEFT, padx=(0, 6))
+
+        manage_frame = ttk.Frame(frame)
+        manage_frame.pack(fill="x")
+        self.delete_batch_btn = ttk.Button(manage_frame, text="Delete selected batches", command=self.delete_selected_batches, state="disabled")
+        self.delete_batch_btn.pack(side=LEFT, padx=(0, 6))
+        ttk.Button(manage_frame, text="Retention policy...", command=self.edit_retention_policy).pack(side=LEFT, padx=(0, 6))
+        self.disk_usage = StringVar()
+        ttk.Label(manage_frame, textvariable=self.disk_usage).pack(side=RIGHT)
 
     def _format_sticker_option(self, sticker: StickerSize) -> str:
         return f"{sticker.id}: {sticker.name} ({sticker.width}x{sticker.height}mm, {sticker.cols}x{sticker.rows})"
@@ -197,8 +268,11 @@ class QRApp:
         selection = self.sizes_tree.selection()
         if not selection:
             return
-        sticker_id = int(selection[0])
-        batches.database.delete_sticker_size(sticker_id)
+        try:
+            database.delete_sticker_size(int(selection[0]))
+        except ValueError as exc:
+            messagebox.showerror("Sticker size in use", str(exc))
+            return
         self.sticker_sizes = batches.list_sticker_sizes()
         self._refresh_sizes_tree()
         self.sticker_dropdown["values"] = [self._format_sticker_option(s) for s in self.sticker_sizes]
@@ -220,31 +294,84 @@ class QRApp:
             messagebox.showerror("No sticker size", "Please add at least one sticker size.")
             return
         batch_name = self.batch_name_entry.get().strip() or f"Batch {datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        self.generate_button.configure(state="disabled")
-        self.progress.set("Generating serial numbers...")
-        threading.Thread(target=self._generate_batch, args=(count, sticker, batch_name), daemon=True).start()
-
-    def _generate_batch(self, count: int, sticker: StickerSize, batch_name: str) -> None:
-        serials = generate_unique_serials(count)
-        batch = batches.create_batch(batch_name, sticker.id, serials)
-        export_qr_images(batch.id, serials)
-        export_sheet(
-            batch.id,
-            serials,
-            sticker.name,
-            sticker.width,
-            sticker.height,
-            sticker.margin_x,
-            sticker.margin_y,
-            sticker.rows,
-            sticker.cols,
-        )
-        self.root.after(0, self._after_generation, batch)
+        job = jobs.create_job(batch_name, sticker.id, count)
+        self._submit_task(runner.TASK_GENERATE, (job.id,), f"Generate {count} codes: {batch_name}", self._selected_priority())
 
-    def _after_generation(self, batch: Batch) -> None:
-        self.generate_button.configure(state="normal")
-        self.progress.set(f"Batch {batch.id} created with {batch.count} QR codes")
-        self.refresh_history()
+    def handle_cancel(self) -> None:
+        for item in self.jobs_tree.selection():
+            self.runner.cancel(int(item))
+            self._show_task(self.runner.tasks[int(item)])
+
+    def on_job_select(self, event=None) -> None:  # type: ignore[override]
+        state = "normal" if self.jobs_tree.selection() else "disabled"
+        self.cancel_button.configure(state=state)
+
+    def on_max_workers_change(self, event=None) -> None:  # type: ignore[override]
+        try:
+            self.runner.set_max_workers(int(self.max_workers_var.get()))
+        except ValueError:
+            self.max_workers_var.set(str(self.runner.max_workers))
+
+    def _selected_priority(self) -> int:
+        idx = self.priority_dropdown.current()
+        return idx if idx >= 0 else runner.PRIORITY_NORMAL
+
+    def _resume_unfinished_jobs(self) -> None:
+        pending = jobs.list_unfinished_jobs()
+        if not pending:
+            return
+        self.progress.set(f"Resuming {len(pending)} unfinished job(s)...")
+        for job in pending:
+            action = "Finish cancelling" if job.status == jobs.JOB_CANCELLING else "Resume"
+            self._submit_task(runner.TASK_GENERATE, (job.id,), f"{action}: {job.name}", runner.PRIORITY_LOW)
+
+    def _submit_task(self, kind: str, args: Tuple, label: str, priority: int) -> None:
+        task = self.runner.submit(kind, args, label, priority)
+        self._show_task(task)
+
+    def _show_task(self, task: RunnerTask) -> None:
+        values = (
+            task.id,
+            task.label,
+            runner.PRIORITY_LABELS.get(task.priority, ""),
+            task.status,
+            task.message.replace("\n", " "),
+        )
+        if self.jobs_tree.exists(str(task.id)):
+            self.jobs_tree.item(str(task.id), values=values)
+        else:
+            self.jobs_tree.insert("", END, iid=str(task.id), values=values)
+
+    def _poll_runner(self) -> None:
+        # Rescheduled first so that an error in one update never stops the
+        # runner from starting queued work or reporting progress.
+        self.root.after(RUNNER_POLL_MS, self._poll_runner)
+        refresh = False
+        for task in self.runner.poll():
+            self._show_task(task)
+            if task.status in runner.FINISHED_STATUSES:
+                self._after_task(task)
+                refresh = refresh or task.kind in runner.BATCH_CHANGING_TASKS
+        if refresh:
+            self.refresh_history()
+
+    def _after_task(self, task: RunnerTask) -> None:
+        # Results go to the status line and the jobs list; a modal dialog would
+        # block the Tk loop and with it every other job's progress.
+        if task.status == runner.TASK_FAILED:
+            self.progress.set(f"{task.label} failed: {task.message}")
+        elif task.status == runner.TASK_CANCELLED:
+            self.progress.set(f"{task.label} cancelled")
+        elif task.kind in runner.BATCH_CHANGING_TASKS:
+            self.progress.set(task.message)
+        else:
+            message = task.message.replace("\n", " ")
+            self.progress.set(f"{task.label} finished: {message}")
+
+    def on_close(self) -> None:
+        self.runner.shutdown()
+        self.thumbnail_worker.shutdown()
+        self.root.destroy()
 
     def refresh_history(self) -> None:
         for row in self.history_tree.get_children():
@@ -257,43 +384,209 @@ class QRApp:
                     batch.created_display,
                     batch.count,
                     batch.sticker_name,
+                    "...",
                 )
             )
+        self.disk_usage.set("Measuring disk usage...")
+        # Walking the asset folders can take a while for large batches, so it
+        # runs off the Tk thread and fills in the Disk column when done.
+        threading.Thread(target=self._measure_disk_usage, daemon=True).start()
+
+    def _measure_disk_usage(self) -> None:
+        usage = retention.batch_disk_usage()
+        self.root.after(0, self._show_disk_usage, usage)
+
+    def _show_disk_usage(self, usage: Dict[int, Tuple[int, int]]) -> None:
+        for batch_id, (files, rows) in usage.items():
+            if self.history_tree.exists(str(batch_id)):
+                self.history_tree.set(str(batch_id), "Disk", retention.format_size(files + rows))
+        total = sum(files + rows for files, rows in usage.values())
+        self.disk_usage.set(f"{len(usage)} batches, {retention.format_size(total)} on disk")
 
     def on_batch_select(self, event=None) -> None:  # type: ignore[override]
         has_selection = bool(self.history_tree.selection())
         state = "normal" if has_selection else "disabled"
-        for btn in [self.export_qr_btn, self.export_pdf_btn, self.export_csv_btn]:
+        for btn in [self.export_qr_btn, self.export_pdf_btn, self.export_csv_btn, self.export_zpl_btn, self.print_zpl_btn, self.export_raster_btn, self.delete_batch_btn]:
             btn.configure(state=state)
+        self._show_preview()
+
+    def _show_preview(self) -> None:
+        selection = self.history_tree.selection()
+        if not selection:
+            self._set_preview(None, "Select a batch to preview it")
+            return
+        batch_id = int(selection[0])
+        sticker = batches.load_batch_sticker(batch_id)
+        if not sticker:
+            self._set_preview(None, "No preview: the sticker size was deleted")
+            return
+        cached = thumbnails.cached_thumbnails(batch_id, sticker)
+        if cached:
+            try:
+                self._set_preview(cached, "First page and sample codes")
+                return
+            except TclError:
+                # Evicted by the render process before Tk could load it.
+                pass
+        self._set_preview(None, "Rendering preview...")
+        self.thumbnail_worker.request(
+            batch_id,
+            lambda *result: self.root.after(0, self._on_thumbnail_ready, *result),
+        )
+
+    def _on_thumbnail_ready(self, batch_id: int, paths: Optional[Tuple[str, str]], error: Optional[str]) -> None:
+        selection = self.history_tree.selection()
+        if not selection or int(selection[0]) != batch_id:
+            return
+        if error:
+            self._set_preview(None, f"Preview failed: {error}")
+        elif paths:
+            self._set_preview(paths, "First page and sample codes")
+        else:
+            self._set_preview(None, "No preview available")
+
+    def _set_preview(self, paths: Optional[Tuple[str, str]], status: str) -> None:
+        self.preview_status.set(status)
+        # Tk draws PhotoImages lazily, so they must stay referenced while shown.
+        self.preview_images = [PhotoImage(file=path) for path in paths] if paths else []
+        page, samples = self.preview_images if paths else ("", "")
+        self.preview_page_label.configure(image=page)
+        self.preview_samples_label.configure(image=samples)
 
     def export_selected_qrs(self) -> None:
         batch = self._get_selected_batch()
         if not batch:
             return
-        serials = batches.get_batch_serials(batch.id)
-        folder = export_qr_images(batch.id, serials)
-        messagebox.showinfo("Export complete", f"QR images saved to:\n{folder}")
+        self._submit_task(runner.TASK_EXPORT_PNGS, (batch.id,), f"Export QR images: {batch.name}", self._selected_priority())
 
     def export_selected_sheet(self) -> None:
         batch = self._get_selected_batch()
         if not batch:
             return
-        serials = batches.get_batch_serials(batch.id)
-        sticker_row = database.fetch_batch(batch.id)
-        if not sticker_row:
+        self._submit_task(runner.TASK_EXPORT_SHEET, (batch.id,), f"Export sticker sheet: {batch.name}", self._selected_priority())
+
+    def delete_selected_batches(self) -> None:
+        batch_ids = tuple(int(item) for item in self.history_tree.selection())
+        if not batch_ids:
+            return
+        if not messagebox.askyesno(
+            "Delete batches",
+            f"Permanently delete {len(batch_ids)} batch(es) with their serials and files?",
+        ):
+            return
+        self._submit_task(runner.TASK_DELETE_BATCHES, (batch_ids,), f"Delete {len(batch_ids)} batch(es)", runner.PRIORITY_HIGH)
+
+    def edit_retention_policy(self) -> None:
+        policy = retention.load_policy()
+        dialog = Toplevel(self.root)
+        dialog.title("Retention policy")
+        dialog.transient(self.root)
+        dialog.resizable(False, False)
+        frame = ttk.Frame(dialog, padding=16)
+        frame.pack(fill=BOTH, expand=True)
+        age_var = StringVar(value=str(policy.max_age_days))
+        size_var = StringVar(value=str(policy.max_total_mb))
+        ttk.Label(frame, text="Delete batches older than (days, 0 = never):").grid(row=0, column=0, sticky="w")
+        ttk.Entry(frame, textvariable=age_var, width=8).grid(row=0, column=1, sticky="w", padx=(8, 0))
+        ttk.Label(frame, text="Keep total batch storage under (MB, 0 = no limit):").grid(row=1, column=0, sticky="w", pady=(8, 0))
+        ttk.Entry(frame, textvariable=size_var, width=8).grid(row=1, column=1, sticky="w", padx=(8, 0), pady=(8, 0))
+        ttk.Label(frame, text="The oldest batches are removed first. The policy is applied on every launch.").grid(
+            row=2, column=0, columnspan=2, sticky="w", pady=(8, 0)
+        )
+
+        def save(apply_now: bool) -> None:
+            try:
+                new_policy = RetentionPolicy(max_age_days=int(age_var.get() or 0), max_total_mb=int(size_var.get() or 0))
+            except ValueError:
+                messagebox.showerror("Invalid input", "Please enter whole numbers.", parent=dialog)
+                return
+            retention.save_policy(new_policy)
+            dialog.destroy()
+            if apply_now:
+                self._submit_task(runner.TASK_APPLY_RETENTION, (), "Apply retention policy", runner.PRIORITY_NORMAL)
+            self.progress.set("Retention policy saved")
+
+        buttons = ttk.Frame(frame)
+        buttons.grid(row=3, column=0, columnspan=2, sticky="e", pady=(12, 0))
+        ttk.Button(buttons, text="Save", command=lambda: save(False)).pack(side=LEFT, padx=(0, 6))
+        ttk.Button(buttons, text="Save and apply now", command=lambda: save(True)).pack(side=LEFT, padx=(0, 6))
+        ttk.Button(buttons, text="Cancel", command=dialog.destroy).pack(side=LEFT)
+        dialog.grab_set()
+
+    def export_selected_raster(self) -> None:
+        batch = self._get_selected_batch()
+        if not batch:
+            return
+        initial = raster.raster_sheet_path(batch.id, batch.sticker_name or "sheet")
+        path = filedialog.asksaveasfilename(
+            title="Save raster sheet",
+            initialdir=os.path.dirname(initial),
+            initialfile=os.path.basename(initial),
+            defaultextension=".tif",
+            filetypes=[("Multi-page TIFF", "*.tif"), ("PNG (one file per page)", "*.png")],
+        )
+        if not path:
+            return
+        dpi = simpledialog.askinteger(
+            "Raster sheet",
+            "Resolution (dpi):",
+            initialvalue=raster.DEFAULT_DPI,
+            minvalue=72,
+            maxvalue=1200,
+            parent=self.root,
+        )
+        if not dpi:
+            return
+        self._submit_task(
+            runner.TASK_EXPORT_RASTER, (batch.id, path, dpi), f"Export raster sheet: {batch.name}", self._selected_priority()
+        )
+
+    def export_selected_zpl(self) -> None:
+        batch = self._get_selected_batch()
+        if not batch:
+            return
+        dpi = self._ask_printer_dpi()
+        if not dpi:
+            return
+        self._submit_task(runner.TASK_EXPORT_ZPL, (batch.id, dpi), f"Export ZPL labels: {batch.name}", self._selected_priority())
+
+    def print_selected_zpl(self) -> None:
+        batch = self._get_selected_batch()
+        if not batch:
             return
-        pdf = export_sheet(
-            batch.id,
-            serials,
-            sticker_row["sticker_name"],
-            sticker_row["width"],
-            sticker_row["height"],
-            sticker_row["margin_x"],
-            sticker_row["margin_y"],
-            sticker_row["rows"],
-            sticker_row["cols"],
+        address = simpledialog.askstring(
+            "Label printer",
+            "Printer address (host, host:port or [IPv6]:port):",
+            initialvalue=self.printer_address,
+            parent=self.root,
+        )
+        if not address:
+            return
+        try:
+            host, port = zpl.parse_printer_address(address)
+        except ValueError:
+            messagebox.showerror("Invalid address", "Please enter the printer as host, host:port or [IPv6]:port.")
+            return
+        dpi = self._ask_printer_dpi()
+        if not dpi:
+            return
+        self.printer_address = address
+        self._submit_task(
+            runner.TASK_PRINT_ZPL, (batch.id, host, port, dpi), f"Print labels: {batch.name}", self._selected_priority()
+        )
+
+    def _ask_printer_dpi(self) -> Optional[int]:
+        dpi = simpledialog.askinteger(
+            "Label printer",
+            "Printer resolution (dpi):",
+            initialvalue=self.printer_dpi,
+            minvalue=100,
+            maxvalue=600,
+            parent=self.root,
         )
-        messagebox.showinfo("Export complete", f"Sticker sheet saved to:\n{pdf}")
+        if dpi:
+            self.printer_dpi = dpi
+        return dpi
 
     def export_selected_csv(self) -> None:
         batch = self._get_selected_batch()
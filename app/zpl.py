@@ -0,0 +1,163 @@
+import os
+import socket
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .models import StickerSize
+from .qr_utils import atomic_output, ensure_batch_folder, remove_stale_parts
+
+DEFAULT_DPI = 203
+RAW_PRINTER_PORT = 9100
+SEND_CHUNK_BYTES = 16 * 1024
+SEND_TIMEOUT_SECONDS = 30
+
+# Name under which the label layout is stored on the printer. Each label then
+# only carries its field data, which keeps the stream to a few dozen bytes per
+# sticker.
+FORMAT_NAME = "R:QRLABEL.ZPL"
+MAX_MAGNIFICATION = 10
+TEXT_HEIGHT_MM = 3.0
+
+# Byte-mode capacity of QR versions 1-10 at error correction level M.
+_QR_CAPACITY_M = [14, 26, 42, 62, 84, 106, 122, 152, 180, 213]
+
+
+def mm_to_dots(mm: float, dpi: int) -> int:
+    return int(round(mm / 25.4 * dpi))
+
+
+def _qr_modules(data_length: int) -> int:
+    for version, capacity in enumerate(_QR_CAPACITY_M, start=1):
+        if data_length <= capacity:
+            return 17 + 4 * version
+    raise ValueError("Serial is too long for a printer-rendered QR code")
+
+
+def _field_data(text: str) -> str:
+    # ^ and ~ are ZPL control characters; with ^FH they are sent hex-escaped.
+    return "".join(f"_{ord(ch):02X}" if ch in "^~_" else ch for ch in text)
+
+
+def label_format(sticker: StickerSize, longest_serial: int, dpi: int = DEFAULT_DPI) -> str:
+    # One printed label holds a full row of the sticker grid, so multi-across
+    # rolls use ``cols`` stickers side by side; ``rows`` does not apply to rolls.
+    width = mm_to_dots(sticker.width, dpi)
+    height = mm_to_dots(sticker.height, dpi)
+    gap = mm_to_dots(sticker.margin_x, dpi)
+    text_height = mm_to_dots(TEXT_HEIGHT_MM, dpi)
+    # ^BQ adds a quiet zone of roughly two modules on every side.
+    modules = _qr_modules(longest_serial) + 4
+    code_area = min(width, height - text_height)
+    magnification = max(1, min(MAX_MAGNIFICATION, code_area // modules))
+    code_size = magnification * modules
+
+    commands = [
+        "^XA",
+        f"^DF{FORMAT_NAME}^FS",
+        "^CI28",
+        f"^PW{gap + sticker.cols * (width + gap)}",
+        f"^LL{height}",
+        "^LH0,0",
+    ]
+    for col in range(sticker.cols):
+        x = gap + col * (width + gap)
+        code_x = x + (width - code_size) // 2
+        code_y = max(0, (height - text_height - code_size) // 2)
+        commands.append(f"^FO{code_x},{code_y}^BQN,2,{magnification}^FN{2 * col + 1}^FS")
+        commands.append(
+            f"^FO{x},{height - text_height}^A0N,{text_height},{text_height}"
+            f"^FB{width},1,0,C^FN{2 * col + 2}^FS"
+        )
+    commands.append("^XZ")
+    return "".join(commands) + "\n"
+
+
+def label_data(serials: Sequence[str]) -> str:
+    fields = []
+    for col, serial in enumerate(serials):
+        data = _field_data(serial)
+        fields.append(f"^FN{2 * col + 1}^FH^FDMA,{data}^FS^FN{2 * col + 2}^FH^FD{data}^FS")
+    return f"^XA^XF{FORMAT_NAME}^FS{''.join(fields)}^XZ\n"
+
+
+def iter_batch_zpl(serials: Sequence[str], sticker: StickerSize, dpi: int = DEFAULT_DPI) -> Iterator[str]:
+    if not serials:
+        return
+    yield label_format(sticker, max(len(serial) for serial in serials), dpi)
+    for start in range(0, len(serials), sticker.cols):
+        yield label_data(serials[start:start + sticker.cols])
+
+
+def iter_chunks(commands: Iterable[str], chunk_size: int = SEND_CHUNK_BYTES) -> Iterator[bytes]:
+    pending: List[bytes] = []
+    size = 0
+    for command in commands:
+        data = command.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def zpl_path(batch_id: int, sticker_name: str) -> str:
+    folder = ensure_batch_folder(batch_id)
+    return os.path.join(folder, f"{sticker_name.replace(' ', '_')}_labels.zpl")
+
+
+def export_zpl(
+    batch_id: int,
+    serials: Sequence[str],
+    sticker: StickerSize,
+    dpi: int = DEFAULT_DPI,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> str:
+    path = zpl_path(batch_id, sticker.name)
+    remove_stale_parts(batch_id)
+    written = 0
+    with atomic_output(path) as temp_path, open(temp_path, "wb") as handle:
+        for chunk in iter_chunks(iter_batch_zpl(serials, sticker, dpi)):
+            handle.write(chunk)
+            written += len(chunk)
+            if on_chunk:
+                on_chunk(written)
+    return path
+
+
+def send_zpl(
+    chunks: Iterable[bytes],
+    host: str,
+    port: int = RAW_PRINTER_PORT,
+    timeout: float = SEND_TIMEOUT_SECONDS,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> int:
+    sent = 0
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        # A small send buffer makes the printer's own receive window the limit,
+        # so a slow printer blocks the sender instead of the stream piling up in
+        # the OS buffer, and a stalled one surfaces as a timeout.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_CHUNK_BYTES)
+        for chunk in chunks:
+            sock.sendall(chunk)
+            sent += len(chunk)
+            if on_chunk:
+                on_chunk(sent)
+        sock.shutdown(socket.SHUT_WR)
+    return sent
+
+
+def parse_printer_address(address: str) -> Tuple[str, int]:
+    # Accepts "host", "host:port", a bare IPv6 address ("fe80::1") or a
+    # bracketed one with a port ("[fe80::1]:9100").
+    address = address.strip()
+    if address.startswith("["):
+        host, bracket, rest = address[1:].partition("]")
+        if not bracket or (rest and not rest.startswith(":")):
+            raise ValueError(f"Invalid printer address: {address}")
+        return host, int(rest[1:]) if rest else RAW_PRINTER_PORT
+    host, _, port = address.rpartition(":")
+    if not host or ":" in host:
+        return address, RAW_PRINTER_PORT
+    return host, int(port)
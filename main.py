@@ -1,3 +1,5 @@
+import multiprocessing
+
 from app.seed import ensure_seed_data
 from app.ui import launch_app
 
@@ -8,4 +10,5 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
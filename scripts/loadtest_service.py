@@ -0,0 +1,113 @@
+"""Latency/throughput load test for the local QR HTTP service.
+
+Start the service first (``python -m app.service``), then run for example::
+
+    python scripts/loadtest_service.py --concurrency 32 --requests 5000
+    python scripts/loadtest_service.py --path /batches/1/serials.csv --requests 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import string
+import time
+from typing import List, Tuple
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, int]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        size = 0
+        while True:
+            chunk_size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+            if chunk_size == 0:
+                return status, size
+    length = int(headers.get("content-length", 0))
+    await reader.readexactly(length)
+    return status, length
+
+
+def _make_path(template: str, distinct: int) -> str:
+    if "{serial}" not in template:
+        return template
+    rng = random.Random(random.randrange(distinct) if distinct else None)
+    serial = "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+    return template.replace("{serial}", serial)
+
+
+async def _client(host: str, port: int, args, remaining: List[int], latencies: List[float], errors: List[int]) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    received = 0
+    try:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            path = _make_path(args.path, args.distinct)
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n"
+            start = time.perf_counter()
+            writer.write(request.encode("latin-1"))
+            await writer.drain()
+            status, size = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            received += size
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+    return received
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args) -> None:
+    remaining = [args.requests]
+    latencies: List[float] = []
+    errors: List[int] = []
+    start = time.perf_counter()
+    sizes = await asyncio.gather(
+        *(_client(args.host, args.port, args, remaining, latencies, errors) for _ in range(args.concurrency))
+    )
+    elapsed = time.perf_counter() - start
+    if not latencies:
+        print("No requests completed")
+        return
+    ms = [value * 1000 for value in latencies]
+    print(f"Requests:    {len(latencies)} ({len(errors)} errors) over {args.concurrency} connections")
+    print(f"Elapsed:     {elapsed:.2f}s")
+    print(f"Throughput:  {len(latencies) / elapsed:.1f} req/s, {sum(sizes) / elapsed / 1024 / 1024:.2f} MiB/s")
+    print(
+        f"Latency ms:  mean {statistics.mean(ms):.2f}  p50 {_percentile(ms, 50):.2f}  "
+        f"p95 {_percentile(ms, 95):.2f}  p99 {_percentile(ms, 99):.2f}  max {max(ms):.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/qr/{serial}.png", help="request path; {serial} is replaced per request")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=0,
+        help="number of distinct serials to cycle through (0 = always new, i.e. no cache hits)",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
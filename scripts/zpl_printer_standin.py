@@ -0,0 +1,58 @@
+"""Local stand-in for a raw TCP (port 9100) ZPL label printer.
+
+Accepts print jobs, saves each one to a file and reports how many labels it
+contained. ``--rate`` throttles reading to mimic a slow printer so the
+sender's flow control can be observed::
+
+    python scripts/zpl_printer_standin.py --port 9100 --rate 20000
+"""
+import argparse
+import os
+import socket
+import time
+from datetime import datetime
+
+
+def serve(host: str, port: int, output_dir: str, rate: int, buffer_size: int) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    with socket.create_server((host, port)) as server:
+        print(f"Listening on {host}:{port}, saving jobs to {output_dir}")
+        while True:
+            conn, peer = server.accept()
+            with conn:
+                # A small receive buffer lets --rate actually push back on the sender.
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+                path = os.path.join(output_dir, f"job_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.zpl")
+                received = 0
+                start = time.perf_counter()
+                with open(path, "wb") as handle:
+                    while True:
+                        data = conn.recv(buffer_size)
+                        if not data:
+                            break
+                        handle.write(data)
+                        received += len(data)
+                        if rate:
+                            time.sleep(len(data) / rate)
+                elapsed = time.perf_counter() - start
+                with open(path, "rb") as handle:
+                    labels = handle.read().count(b"^XF")
+                print(f"{peer[0]}: {labels} labels, {received} bytes in {elapsed:.2f}s -> {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--output-dir", default="zpl_jobs")
+    parser.add_argument("--rate", type=int, default=0, help="bytes per second to accept (0 = unlimited)")
+    parser.add_argument("--buffer-size", type=int, default=4096)
+    args = parser.parse_args()
+    try:
+        serve(args.host, args.port, args.output_dir, args.rate, args.buffer_size)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
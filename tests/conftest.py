@@ -0,0 +1,16 @@
+import pytest
+
+from app import database, qr_utils, retention, thumbnails
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # Every test gets its own database and asset folders.
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "app.db"))
+    batches_dir = str(tmp_path / "batches")
+    monkeypatch.setattr(qr_utils, "BATCHES_DIR", batches_dir)
+    monkeypatch.setattr(retention, "BATCHES_DIR", batches_dir)
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_DIR", str(tmp_path / "thumbnails"))
+    database.init_db()
+    database.seed_sticker_sizes()
+    return tmp_path
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from app import database, jobs
+from app.qr_utils import batch_folder
+
+
+class Killed(BaseException):
+    # Stands in for the worker process being terminated: run_job() only
+    # handles Exception, so the job keeps its last checkpoint.
+    pass
+
+
+@pytest.fixture
+def rendered(data_dir, monkeypatch):
+    serials = []
+
+    def fake_save_qr_image(serial, output_path, box_size=10):
+        serials.append(serial)
+        with open(output_path, "wb") as handle:
+            handle.write(b"png")
+
+    def fake_export_sheet(batch_id, batch_serials, *layout, on_page=None):
+        if on_page:
+            on_page(1)
+        return os.path.join(batch_folder(batch_id), "sheet.pdf")
+
+    monkeypatch.setattr(jobs, "save_qr_image", fake_save_qr_image)
+    monkeypatch.setattr(jobs, "export_sheet", fake_export_sheet)
+    monkeypatch.setattr(jobs, "PNG_CHECKPOINT_INTERVAL", 10)
+    return serials
+
+
+def _kill_at(message):
+    def progress(text):
+        if text == message:
+            raise Killed()
+
+    return progress
+
+
+def test_resume_renders_only_images_after_the_checkpoint(rendered):
+    job = jobs.create_job("resume", 1, 35)
+    with pytest.raises(Killed):
+        jobs.run_job(job.id, progress=_kill_at("Rendered 20/35 QR images"))
+
+    job = jobs.load_job(job.id)
+    assert job.status == jobs.JOB_RUNNING
+    assert job.pngs_done == 20
+    assert [j.id for j in jobs.list_unfinished_jobs()] == [job.id]
+
+    serials = database.fetch_serials(job.batch_id)
+    rendered.clear()
+    batch = jobs.run_job(job.id)
+
+    assert batch.id == job.batch_id
+    assert rendered == serials[20:]
+    job = jobs.load_job(job.id)
+    assert job.status == jobs.JOB_DONE
+    assert job.pngs_done == 35
+    assert job.pages_done == 1
+    assert jobs.list_unfinished_jobs() == []
+
+
+def test_cancel_removes_batch_rows_and_folder(rendered):
+    job = jobs.create_job("cancel", 1, 30)
+
+    def should_cancel():
+        return len(rendered) >= 10
+
+    assert jobs.run_job(job.id, should_cancel=should_cancel) is None
+
+    batch_id = database.fetch_last_batch_id()
+    job = jobs.load_job(job.id)
+    assert job.status == jobs.JOB_CANCELLED
+    assert job.batch_id is None
+    assert database.fetch_batch(batch_id) is None
+    assert database.fetch_serials(batch_id) == []
+    assert not os.path.exists(batch_folder(batch_id))
+
+
+def test_cancel_request_for_queued_job_without_batch(data_dir):
+    job = jobs.create_job("queued", 1, 10)
+
+    assert jobs.request_cancel(job.id) is True
+    assert jobs.load_job(job.id).status == jobs.JOB_CANCELLED
+    assert jobs.list_unfinished_jobs() == []
+    assert jobs.run_job(job.id) is None
+
+
+def test_cancel_request_is_cleaned_up_instead_of_resumed(rendered):
+    job = jobs.create_job("interrupted", 1, 30)
+    with pytest.raises(Killed):
+        jobs.run_job(job.id, progress=_kill_at("Rendered 10/30 QR images"))
+    batch_id = jobs.load_job(job.id).batch_id
+
+    assert jobs.request_cancel(job.id) is False
+    assert jobs.load_job(job.id).status == jobs.JOB_CANCELLING
+    assert [j.id for j in jobs.list_unfinished_jobs()] == [job.id]
+
+    # On the next launch the job is picked up again, but only to clean up.
+    rendered.clear()
+    assert jobs.run_job(job.id) is None
+    assert rendered == []
+    assert jobs.load_job(job.id).status == jobs.JOB_CANCELLED
+    assert database.fetch_batch(batch_id) is None
+    assert not os.path.exists(batch_folder(batch_id))
+
+
+def test_unfinished_job_blocks_sticker_size_deletion(data_dir):
+    sticker_id = database.insert_sticker_size("spare", 20, 20, 2, 2, 4, 4)
+    job = jobs.create_job("queued", sticker_id, 10)
+
+    with pytest.raises(ValueError):
+        database.delete_sticker_size(sticker_id)
+
+    jobs.request_cancel(job.id)
+    database.delete_sticker_size(sticker_id)
+    assert sticker_id not in [row["id"] for row in database.fetch_sticker_sizes()]
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import qr_utils
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _touch(folder, name):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as handle:
+        handle.write(b"0123456789")
+    return path
+
+
+def test_remove_stale_parts_only_removes_parts_of_dead_exports(data_dir):
+    folder = qr_utils.ensure_batch_folder(7)
+    stale = _touch(folder, f"sheet.pdf.{_dead_pid()}.part")
+    live = _touch(folder, f"sheet.pdf.{os.getpid()}.part")
+    download = _touch(folder, "movie.mkv.part")
+    other = _touch(folder, "sheet.pdf")
+
+    assert qr_utils.remove_stale_parts(7) == 10
+
+    assert not os.path.exists(stale)
+    assert all(os.path.exists(path) for path in (live, download, other))
+
+
+def test_remove_stale_parts_of_missing_batch(data_dir):
+    assert qr_utils.remove_stale_parts(404) == 0
+
+
+def test_atomic_output_keeps_the_old_file_when_writing_fails(data_dir):
+    folder = qr_utils.ensure_batch_folder(7)
+    target = _touch(folder, "sheet.pdf")
+
+    with pytest.raises(KeyboardInterrupt):
+        with qr_utils.atomic_output(target) as temp_path:
+            with open(temp_path, "wb") as handle:
+                handle.write(b"half")
+            raise KeyboardInterrupt()
+
+    assert os.listdir(folder) == ["sheet.pdf"]
+    with open(target, "rb") as handle:
+        assert handle.read() == b"0123456789"
+
+    with qr_utils.atomic_output(target) as temp_path:
+        with open(temp_path, "wb") as handle:
+            handle.write(b"new")
+    assert os.listdir(folder) == ["sheet.pdf"]
+    with open(target, "rb") as handle:
+        assert handle.read() == b"new"
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from app import raster
+from app.models import StickerSize
+
+# 25.4 mm stickers are 100 px at 100 dpi, which fits a version 1 code
+# (21 modules plus a 2 module border) at exactly 4 px per module.
+STICKER = StickerSize(id=1, name="1in x 1in", width=25.4, height=25.4, margin_x=5.0, margin_y=5.0, rows=2, cols=2)
+DPI = 100
+
+
+def test_render_page_draws_the_qr_matrix():
+    matrix = raster.qr_matrix("SN0001")
+    page = raster.render_page(["SN0001"], STICKER, DPI)
+
+    margin = raster.mm_to_px(STICKER.margin_x, DPI)
+    side = raster.mm_to_px(STICKER.width, DPI)
+    scale = side // matrix.shape[0]
+    code = np.repeat(np.repeat(matrix, scale, axis=0), scale, axis=1)
+    top = margin + (side - code.shape[0]) // 2
+    assert page.shape == (raster.page_size(DPI)[1], raster.page_size(DPI)[0])
+    assert np.array_equal(page[top:top + code.shape[0], top:top + code.shape[1]], code)
+    # Nothing is drawn where the second sticker of the row would go.
+    second = margin + side + margin
+    assert not page[margin:margin + side, second:second + side].any()
+
+
+def test_parallel_pages_match_serial_pages():
+    serials = [f"SN{i:04d}" for i in range(raster.PARALLEL_MIN_PAGES * 4 + 1)]
+
+    serial = [image.tobytes() for image in raster.iter_page_images(serials, STICKER, DPI)]
+    parallel = [image.tobytes() for image in raster.iter_page_images(serials, STICKER, DPI, workers=2)]
+
+    assert len(serial) == raster.PARALLEL_MIN_PAGES + 1
+    assert parallel == serial
+
+
+def test_cancelled_png_export_leaves_no_pages(tmp_path):
+    serials = [f"SN{i:04d}" for i in range(12)]
+
+    def on_page(number):
+        if number == 2:
+            raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        raster.export_raster_sheet(serials, STICKER, str(tmp_path / "sheet.png"), DPI, on_page=on_page)
+
+    assert list(tmp_path.iterdir()) == []
+    paths = raster.export_raster_sheet(serials, STICKER, str(tmp_path / "sheet.png"), DPI)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["sheet_p0001.png", "sheet_p0002.png", "sheet_p0003.png"]
+    assert len(paths) == 3
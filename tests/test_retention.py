@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from app import database, jobs, retention
+from app.models import RetentionPolicy
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+MB = 1024 * 1024
+
+
+def _batch(days_old, name="batch"):
+    created_at = (NOW - timedelta(days=days_old)).isoformat(timespec="seconds")
+    batch_id = database.insert_batch(name, created_at, 1, 1)
+    database.insert_serials(batch_id, [f"{name}-1"])
+    return batch_id
+
+
+def _generating_batch(days_old):
+    # A batch whose generation job has not finished yet.
+    job = jobs.create_job("generating", 1, 1)
+    created_at = (NOW - timedelta(days=days_old)).isoformat(timespec="seconds")
+    return database.insert_job_batch(job.id, created_at, ["generating-1"])
+
+
+def test_age_limit_selects_old_batches_only(data_dir):
+    old = _batch(40, "old")
+    _batch(5, "recent")
+    _generating_batch(60)
+
+    expired = retention.select_expired(RetentionPolicy(max_age_days=30), {}, NOW)
+
+    assert expired == [old]
+
+
+def test_size_limit_removes_oldest_unprotected_first(data_dir):
+    protected = _generating_batch(30)
+    oldest = _batch(20, "oldest")
+    middle = _batch(10, "middle")
+    newest = _batch(1, "newest")
+    usage = {batch_id: (MB, 0) for batch_id in (protected, oldest, middle, newest)}
+
+    expired = retention.select_expired(RetentionPolicy(max_total_mb=2), usage, NOW)
+
+    assert expired == [oldest, middle]
+
+
+def test_size_limit_never_selects_protected_batches(data_dir):
+    protected = _generating_batch(30)
+    other = _batch(10, "other")
+    usage = {protected: (10 * MB, 0), other: (MB, 0)}
+
+    expired = retention.select_expired(RetentionPolicy(max_total_mb=1), usage, NOW)
+
+    assert expired == [other]
+
+
+def test_age_and_size_limits_combined(data_dir):
+    old = _batch(40, "old")
+    middle = _batch(10, "middle")
+    newest = _batch(1, "newest")
+    usage = {old: (MB, 0), middle: (MB, 0), newest: (MB, 0)}
+
+    expired = retention.select_expired(RetentionPolicy(max_age_days=30, max_total_mb=1), usage, NOW)
+
+    assert expired == [old, middle]
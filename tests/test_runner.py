@@ -0,0 +1,63 @@
+from app import database, jobs, runner
+
+
+def test_cancelling_queued_generation_is_persisted(data_dir):
+    job_runner = runner.JobRunner(max_workers=1)
+    fresh = jobs.create_job("fresh", 1, 10)
+    partial = jobs.create_job("partial", 1, 10)
+    database.insert_job_batch(partial.id, "2024-01-01T00:00:00", ["A1", "A2"])
+    fresh_task = job_runner.submit(runner.TASK_GENERATE, (fresh.id,), "fresh")
+    partial_task = job_runner.submit(runner.TASK_GENERATE, (partial.id,), "partial")
+
+    job_runner.cancel(fresh_task.id)
+    job_runner.cancel(partial_task.id)
+
+    # Nothing to clean up for the fresh job, so it is cancelled outright; the
+    # partial one stays queued until a worker has removed its batch.
+    assert fresh_task.status == runner.TASK_CANCELLED
+    assert partial_task.status == runner.TASK_QUEUED
+    assert jobs.load_job(fresh.id).status == jobs.JOB_CANCELLED
+    assert jobs.load_job(partial.id).status == jobs.JOB_CANCELLING
+
+
+class _FakeProcess:
+    def __init__(self, target, args, daemon):
+        self.args = args
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+
+def test_parallel_tasks_get_the_slots_no_queued_task_needs(monkeypatch):
+    job_runner = runner.JobRunner(max_workers=4)
+    monkeypatch.setattr(job_runner._context, "Process", _FakeProcess)
+    first = job_runner.submit(runner.TASK_EXPORT_PNGS, (1,), "pngs")
+    raster_task = job_runner.submit(runner.TASK_EXPORT_RASTER, (1, "out.tif", 300), "raster")
+    waiting = job_runner.submit(runner.TASK_EXPORT_SHEET, (1,), "sheet", runner.PRIORITY_LOW)
+    late = job_runner.submit(runner.TASK_EXPORT_SHEET, (2,), "sheet", runner.PRIORITY_LOW)
+
+    job_runner.poll()
+
+    # The PNG export and the raster export start first; the raster export
+    # leaves one slot for each of the two sheet exports still queued.
+    assert job_runner._processes[raster_task.id].args[2] == (1, "out.tif", 300, 1)
+    assert [first.status, raster_task.status, waiting.status, late.status] == [runner.TASK_RUNNING] * 4
+    assert job_runner.busy_slots == 4
+
+
+def test_parallel_task_keeps_its_slots_while_running(monkeypatch):
+    job_runner = runner.JobRunner(max_workers=4)
+    monkeypatch.setattr(job_runner._context, "Process", _FakeProcess)
+    raster_task = job_runner.submit(runner.TASK_EXPORT_RASTER, (1, "out.tif", 300), "raster")
+    queued = job_runner.submit(runner.TASK_EXPORT_SHEET, (1,), "sheet")
+
+    job_runner.poll()
+    assert queued.status == runner.TASK_RUNNING
+    assert job_runner._processes[raster_task.id].args[2][-1] == 3
+
+    later = job_runner.submit(runner.TASK_EXPORT_SHEET, (2,), "sheet")
+    job_runner.poll()
+    assert later.status == runner.TASK_QUEUED
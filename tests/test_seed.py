@@ -0,0 +1,22 @@
+from app import database, retention, seed
+
+
+def test_demo_batch_is_seeded_once(data_dir):
+    seed.ensure_seed_data()
+    batches = database.fetch_batches()
+    assert [row["name"] for row in batches] == [seed.SAMPLE_BATCH_NAME]
+
+    retention.delete_batches([batches[0]["id"]])
+    seed.ensure_seed_data()
+
+    assert database.fetch_batches() == []
+
+
+def test_existing_history_is_not_seeded(data_dir):
+    batch_id = database.insert_batch("mine", "2024-01-01T00:00:00", 1, 0)
+    database.delete_batches([batch_id])
+
+    seed.ensure_seed_data()
+
+    assert database.fetch_batches() == []
+    assert database.fetch_setting(seed.SETTING_DEMO_SEEDED) == "1"
@@ -0,0 +1,166 @@
+import asyncio
+import io
+import json
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from app import database, service
+
+
+@pytest.fixture
+def exports_dir(data_dir, monkeypatch):
+    folder = data_dir / "exports"
+    folder.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(folder))
+    return folder
+
+
+def _serve(scenario):
+    async def main():
+        with ThreadPoolExecutor() as executor:
+            server, _ = await service.start_service("127.0.0.1", 0, executor)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await scenario(port)
+            finally:
+                server.close()
+                await server.wait_closed()
+
+    return asyncio.run(main())
+
+
+async def _fetch(port, method, path, body=b"", version="HTTP/1.1"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} {version}", f"Content-Length: {len(body)}"]
+    if version == "HTTP/1.1":
+        lines.append("Connection: close")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    data = await reader.read()
+    writer.close()
+    head, _, payload = data.partition(b"\r\n\r\n")
+    head_lines = head.decode("latin-1").split("\r\n")
+    status = int(head_lines[0].split(" ")[1])
+    headers = {}
+    for line in head_lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        payload = _dechunk(payload)
+    return status, headers, payload
+
+
+def _dechunk(payload):
+    body = b""
+    while True:
+        size_line, _, payload = payload.partition(b"\r\n")
+        size = int(size_line, 16)
+        if size == 0:
+            return body
+        body += payload[:size]
+        payload = payload[size + 2 :]
+
+
+async def _create(port, count):
+    body = json.dumps({"name": "api", "count": count, "sticker_size_id": 1}).encode()
+    status, _, payload = await _fetch(port, "POST", "/batches", body)
+    assert status == 201
+    return json.loads(payload)
+
+
+def test_create_batch_stores_batch_and_serials(data_dir):
+    async def scenario(port):
+        created = await _create(port, 5)
+        status, _, payload = await _fetch(port, "GET", f"/batches/{created['id']}")
+        return created, status, json.loads(payload)
+
+    created, status, loaded = _serve(scenario)
+
+    assert created["count"] == 5
+    assert status == 200
+    assert loaded == created
+    serials = database.fetch_serials(created["id"])
+    assert len(set(serials)) == 5
+
+
+def test_csv_export_is_chunked(data_dir, monkeypatch):
+    monkeypatch.setattr(service, "CSV_ROWS_PER_CHUNK", 2)
+
+    async def scenario(port):
+        created = await _create(port, 5)
+        return created, await _fetch(port, "GET", f"/batches/{created['id']}/serials.csv")
+
+    created, (status, headers, payload) = _serve(scenario)
+
+    assert status == 200
+    assert headers["transfer-encoding"] == "chunked"
+    rows = payload.decode("utf-8").splitlines()
+    assert rows[0] == "batch_id,batch_name,created_at,sticker_size,serial"
+    assert [row.split(",")[-1] for row in rows[1:]] == database.fetch_serials(created["id"])
+
+
+def test_pdf_and_zip_exports_are_streamed_from_removed_temp_files(exports_dir):
+    async def scenario(port):
+        created = await _create(port, 3)
+        pdf = await _fetch(port, "GET", f"/batches/{created['id']}/sheet.pdf")
+        codes = await _fetch(port, "GET", f"/batches/{created['id']}/codes.zip")
+        return created, pdf, codes
+
+    created, pdf, codes = _serve(scenario)
+
+    status, headers, payload = pdf
+    assert status == 200
+    assert headers["content-type"] == "application/pdf"
+    assert headers["transfer-encoding"] == "chunked"
+    assert payload
+    status, headers, payload = codes
+    assert status == 200
+    assert 'filename="batch_1_codes.zip"' in headers["content-disposition"]
+    names = zipfile.ZipFile(io.BytesIO(payload)).namelist()
+    assert names == [f"{serial}.png" for serial in database.fetch_serials(created["id"])]
+    assert list(exports_dir.iterdir()) == []
+
+
+def test_qr_render(data_dir):
+    status, headers, payload = _serve(lambda port: _fetch(port, "GET", "/qr/HELLO%20WORLD.png?box_size=4"))
+
+    assert status == 200
+    assert headers["content-type"] == "image/png"
+    image = Image.open(io.BytesIO(payload))
+    assert image.format == "PNG"
+    assert image.size[0] % 4 == 0
+
+
+@pytest.mark.parametrize(
+    "method, path, body, expected",
+    [
+        ("POST", "/batches", b"[]", 400),
+        ("POST", "/batches", b'{"count": 0, "sticker_size_id": 1}', 400),
+        ("POST", "/batches", b'{"count": 1, "sticker_size_id": 999}', 400),
+        ("GET", "/qr/A.png?box_size=0", b"", 400),
+        ("GET", "/batches/404", b"", 404),
+        ("GET", "/nowhere", b"", 404),
+        ("DELETE", "/batches", b"", 405),
+    ],
+)
+def test_error_statuses(data_dir, method, path, body, expected):
+    status, _, payload = _serve(lambda port: _fetch(port, method, path, body))
+
+    assert status == expected
+    assert "error" in json.loads(payload)
+
+
+def test_http_1_0_gets_an_unchunked_body_and_a_closed_connection(data_dir):
+    async def scenario(port):
+        created = await _create(port, 3)
+        return await _fetch(port, "GET", f"/batches/{created['id']}/serials.csv", version="HTTP/1.0")
+
+    status, headers, payload = _serve(scenario)
+
+    assert status == 200
+    assert headers["connection"] == "close"
+    assert "transfer-encoding" not in headers
+    assert len(payload.decode("utf-8").splitlines()) == 4
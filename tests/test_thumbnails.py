@@ -0,0 +1,87 @@
+import dataclasses
+import os
+
+from app import batches, thumbnails
+
+
+def _set_mtime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+
+def test_cache_key_changes_with_the_sticker_layout(data_dir):
+    sticker = batches.list_sticker_sizes()[0]
+    key = thumbnails.cache_key(5, sticker)
+
+    assert key.startswith("5_")
+    assert thumbnails.cache_key(5, dataclasses.replace(sticker, name="Renamed")) == key
+    changes = {"width": 30.0, "height": 30.0, "margin_x": 1.0, "margin_y": 1.0, "rows": 2, "cols": 1}
+    for field, value in changes.items():
+        assert thumbnails.cache_key(5, dataclasses.replace(sticker, **{field: value})) != key
+
+
+def test_cache_key_changes_with_the_thumbnail_version(data_dir, monkeypatch):
+    sticker = batches.list_sticker_sizes()[0]
+    key = thumbnails.cache_key(5, sticker)
+
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_VERSION", thumbnails.THUMBNAIL_VERSION + 1)
+
+    assert thumbnails.cache_key(5, sticker) != key
+
+
+def test_build_thumbnails_then_cache_hit(data_dir):
+    batch = batches.create_batch("preview", 1, ["SN0001", "SN0002", "SN0003", "SN0004"])
+    sticker = batches.load_batch_sticker(batch.id)
+
+    assert thumbnails.cached_thumbnails(batch.id, sticker) is None
+    paths = thumbnails.build_thumbnails(batch.id)
+
+    assert paths == thumbnails.thumbnail_paths(batch.id, sticker)
+    assert all(os.path.exists(path) for path in paths)
+    assert thumbnails.cached_thumbnails(batch.id, sticker) == paths
+
+
+def test_evict_removes_least_recently_used_files_first(data_dir):
+    folder = data_dir / "thumbnails"
+    folder.mkdir()
+    for age, name in enumerate(["newest.png", "middle.png", "oldest.png"]):
+        path = folder / name
+        path.write_bytes(b"x" * 100)
+        _set_mtime(path, 1_000_000 - age * 10)
+
+    thumbnails.evict(150)
+
+    assert sorted(os.listdir(folder)) == ["newest.png"]
+
+
+def test_cached_thumbnails_misses_after_eviction(data_dir):
+    old = batches.create_batch("old", 1, ["SN0001"])
+    new = batches.create_batch("new", 1, ["SN0002"])
+    sticker = batches.load_batch_sticker(old.id)
+    old_paths = thumbnails.build_thumbnails(old.id)
+    for path in old_paths:
+        _set_mtime(path, 1_000_000)
+    new_paths = thumbnails.build_thumbnails(new.id)
+
+    # Room for one batch only: the least recently viewed one goes.
+    thumbnails.evict(sum(os.path.getsize(path) for path in new_paths))
+
+    assert thumbnails.cached_thumbnails(old.id, sticker) is None
+    assert thumbnails.cached_thumbnails(new.id, sticker) == new_paths
+
+
+def test_purge_batch_ignores_files_removed_meanwhile(data_dir, monkeypatch):
+    folder = data_dir / "thumbnails"
+    folder.mkdir()
+    for name in ["3_a_page.png", "3_a_samples.png", "33_a_page.png"]:
+        (folder / name).write_bytes(b"x")
+    remove = os.remove
+
+    def remove_twice(path):
+        # Another process evicts the file just before it is removed here.
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(thumbnails.os, "remove", remove_twice)
+    thumbnails.purge_batch(3)
+
+    assert os.listdir(folder) == ["33_a_page.png"]
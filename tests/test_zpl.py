@@ -0,0 +1,95 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from app import batches, runner, zpl
+from app.models import StickerSize
+
+STICKER = StickerSize(id=1, name="1in x 1in", width=25.4, height=25.4, margin_x=5.0, margin_y=5.0, rows=8, cols=3)
+
+
+class _Printer:
+    # Accepts one connection and keeps everything sent until the sender
+    # closes its side, like a raw port 9100 printer.
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.received = b""
+        self.thread = threading.Thread(target=self._receive)
+        self.thread.start()
+
+    def _receive(self):
+        conn, _ = self.server.accept()
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                self.received += data
+        self.server.close()
+
+
+def test_send_zpl_streams_one_label_per_row():
+    serials = [f"SN{i:05d}" for i in range(1000)]
+    printer = _Printer()
+    sizes = []
+
+    sent = zpl.send_zpl(
+        zpl.iter_chunks(zpl.iter_batch_zpl(serials, STICKER)),
+        "127.0.0.1",
+        printer.port,
+        timeout=5,
+        on_chunk=sizes.append,
+    )
+    printer.thread.join(5)
+
+    assert sent == len(printer.received) == sizes[-1]
+    stream = printer.received.decode("utf-8")
+    assert stream.count(f"^DF{zpl.FORMAT_NAME}") == 1
+    assert stream.count(f"^XF{zpl.FORMAT_NAME}") == 334
+    assert "^FDMA,SN00999^FS" in stream
+
+
+@pytest.mark.parametrize(
+    "address, expected",
+    [
+        ("printer", ("printer", 9100)),
+        (" printer:9101 ", ("printer", 9101)),
+        ("10.0.0.5:6101", ("10.0.0.5", 6101)),
+        ("fe80::1", ("fe80::1", 9100)),
+        ("[fe80::1]", ("fe80::1", 9100)),
+        ("[fe80::1]:9101", ("fe80::1", 9101)),
+    ],
+)
+def test_parse_printer_address(address, expected):
+    assert zpl.parse_printer_address(address) == expected
+
+
+@pytest.mark.parametrize("address", ["printer:abc", "printer:", "[fe80::1", "[fe80::1]9100", "[fe80::1]:x"])
+def test_parse_printer_address_rejects_bad_ports(address):
+    with pytest.raises(ValueError):
+        zpl.parse_printer_address(address)
+
+
+def test_label_format_dimensions():
+    commands = zpl.label_format(STICKER, longest_serial=10, dpi=203)
+
+    # 25.4 mm is 203 dots at 203 dpi and the 5 mm gap 40 dots, on both sides
+    # of each of the three stickers across.
+    assert "^PW769^" in commands
+    assert "^LL203^" in commands
+    assert all(f"^FN{n}^" in commands for n in range(1, 7))
+    assert "^FO40,179^A0N,24,24^FB203,1,0,C^FN2^FS" in commands
+    assert "^FO283,179^" in commands
+
+
+def test_export_zpl_task_stops_when_cancelled(data_dir):
+    batch = batches.create_batch("labels", 1, [f"SN{i:05d}" for i in range(50)])
+    path = zpl.zpl_path(batch.id, batch.sticker_name)
+
+    result = runner._run_export_zpl(batch.id, zpl.DEFAULT_DPI, lambda: True, lambda text: None)
+
+    assert result is None
+    assert os.listdir(os.path.dirname(path)) == []